@@ -5,164 +5,153 @@ Each minority class receives a new dataframe to which the back-translantions are
 They are saved as seperate csv files in the current directory. The dataframes need to be merged again afterwards.
 """
 
-import sys
+import argparse
+import multiprocessing
+import torch
 import pandas as pd 
 from transformers import MarianMTModel, MarianTokenizer
+from model_registry import ModelRegistry, MEMORY_BUDGET
+from batching import length_buckets
+from translation_cache import TranslationCache, TRANSLATION_CACHE, generation_key, normalize
 
-# get the original data frame to extract minority class
-df = pd.read_csv(sys.argv[1])
-
-# seperate classes, keeping all of their label-annotations 
-class_to_augment = sys.argv[2]
-class_to_augment_df = df[df[class_to_augment].isin(['X', 'x'])]
+# padded tokens per generate call (batch size x longest message of the batch)
+MAX_BATCH_TOKENS = 4096
+# the models only accept inputs <= 512 tokens
+MAX_LENGTH = 512
+# model names that do not follow "Helsinki-NLP/opus-mt-<src>-<tgt>"
+MODEL_NAMES = {("en", "ja"): "Helsinki-NLP/opus-mt-en-jap"}
 
 '''
-Load the MarianMTModel.
+Load the MarianMTModel (key: (source language, target language)).
 '''
-def load_translation_model(src_lang, tgt_lang):
-    model_name = f"Helsinki-NLP/opus-mt-{src_lang}-{tgt_lang}"
+def load_model_pair(key):
+    src_lang, tgt_lang = key
+    model_name = MODEL_NAMES.get(key, f"Helsinki-NLP/opus-mt-{src_lang}-{tgt_lang}")
     # get model and tokanizer
     tokenizer = MarianTokenizer.from_pretrained(model_name)
     model = MarianMTModel.from_pretrained(model_name)
+    model.eval()
     return tokenizer, model
 
+# every model is loaded once and stays in memory (least recently used ones are dropped above the budget)
+registry = ModelRegistry(load_model_pair)
+# padded tokens per batch used by translate_batch (set with --max-batch-tokens)
+batch_tokens = MAX_BATCH_TOKENS
+# translations of earlier runs (in memory only until main opens the cache file)
+cache = TranslationCache(None)
+
 '''
-Translate a single sentence.
+Get the MarianMTModel from the registry.
 '''
-def translate(text, tokenizer, model):
-    batch = tokenizer([text], return_tensors="pt", padding=True)
-    generated = model.generate(**batch)
-    return tokenizer.decode(generated[0], skip_special_tokens=True)
+def load_translation_model(src_lang, tgt_lang):
+    return registry.get((src_lang, tgt_lang))
 
 '''
-Back-translate sentence (eng->german->en).
+Translate many sentences. Messages that are in the translation cache are not translated again; the others are
+sorted by token length and translated in buckets of similar length (so there is little padding) and added to the cache.
+The translations are returned in the original order.
 '''
-def back_translate_en_de_en(text):
-    # english -> german
-    tok_en_de, mod_en_de = load_translation_model("en", "de")
-    german_text = translate(text, tok_en_de, mod_en_de)
-    # german -> english
-    tok_de_en, mod_de_en = load_translation_model("de", "en")
-    back_translated = translate(german_text, tok_de_en, mod_de_en)
+def translate_batch(texts, tokenizer, model, max_tokens=None):
+    max_tokens = max_tokens or batch_tokens
+    # identical messages are translated only once
+    unique = list(dict.fromkeys(normalize(text) for text in texts))
+    # cache key: model, generation parameters (incl. the input truncation) and text
+    model_key = model.name_or_path
+    params = generation_key(model, input_max_length=MAX_LENGTH)
+    translations = cache.get_many(model_key, params, unique)
 
-    return back_translated
+    missing = [text for text in unique if text not in translations]
+    if missing:
+        lengths = [len(ids) for ids in tokenizer(missing, truncation=True, max_length=MAX_LENGTH)["input_ids"]]
+        translated = {}
+        for bucket in length_buckets(lengths, max_tokens):
+            bucket_texts = [missing[i] for i in bucket]
+            batch = tokenizer(bucket_texts, return_tensors="pt", padding=True, truncation=True, max_length=MAX_LENGTH)
+            with torch.inference_mode():
+                generated = model.generate(**batch)
+            translated.update(zip(bucket_texts, tokenizer.batch_decode(generated, skip_special_tokens=True)))
+        cache.put_many(model_key, params, translated)
+        translations.update(translated)
+    return [translations[normalize(text)] for text in texts]
 
 '''
-Back-translate sentence (eng->french->en).
+Translate a single sentence.
 '''
-def back_translate_en_fr_en(text):
-    # english -> french
-    tok_en_fr, mod_en_fr = load_translation_model("en", "fr")
-    french_text = translate(text, tok_en_fr, mod_en_fr)
-    # french -> english
-    tok_fr_en, mod_fr_en = load_translation_model("fr", "en")
-    back_translated = translate(french_text, tok_fr_en, mod_fr_en)
-
-    return back_translated
+def translate(text, tokenizer, model):
+    return translate_batch([text], tokenizer, model)[0]
 
 '''
-Back-translate sentence (eng->russian->en).
+Back-translate sentences (eng->pivot language->en), in batches.
 '''
-def back_translate_en_ru_en(text):
-    # english -> russian
-    tok_en_ru, mod_en_ru = load_translation_model("en", "ru")
-    russian_text = translate(text, tok_en_ru, mod_en_ru)
-    # russian -> english
-    tok_ru_en, mod_ru_en = load_translation_model("ru", "en")
-    back_translated = translate(russian_text, tok_ru_en, mod_ru_en)
+def back_translate(texts, pivot):
+    # english -> pivot language
+    tok_en_xx, mod_en_xx = load_translation_model("en", pivot)
+    pivot_texts = translate_batch(texts, tok_en_xx, mod_en_xx)
+    # pivot language -> english
+    tok_xx_en, mod_xx_en = load_translation_model(pivot, "en")
+    back_translated = translate_batch(pivot_texts, tok_xx_en, mod_xx_en)
 
     return back_translated
 
 '''
-Back-translate sentence (eng->chinese->en).
+Back-translate sentences (eng->german->en).
 '''
-def back_translate_en_zh_en(text):
-    # english -> chinese
-    tok_en_zh, mod_en_zh = load_translation_model("en", "zh")
-    chinese_text = translate(text, tok_en_zh, mod_en_zh)
-    # chinese -> english
-    tok_zh_en, mod_zh_en = load_translation_model("zh", "en")
-    back_translated = translate(chinese_text, tok_zh_en, mod_zh_en)
-
-    return back_translated
+def back_translate_en_de_en(texts):
+    return back_translate(texts, "de")
 
 '''
-Back-translate sentence (eng->italian->en).
+Back-translate sentences (eng->french->en).
 '''
-def back_translate_en_it_en(text):
-    # english -> italian
-    tok_en_it, mod_en_it = load_translation_model("en", "it")
-    italian_text = translate(text, tok_en_it, mod_en_it)
-    # italian -> english
-    tok_it_en, mod_it_en = load_translation_model("it", "en")
-    back_translated = translate(italian_text, tok_it_en, mod_it_en)
-
-    return back_translated
+def back_translate_en_fr_en(texts):
+    return back_translate(texts, "fr")
 
 '''
-Back-translate sentence (eng->spanish->en).
+Back-translate sentences (eng->russian->en).
 '''
-def back_translate_en_es_en(text):
-    # english -> spanish
-    tok_en_es, mod_en_es = load_translation_model("en", "es")
-    spanish_text = translate(text, tok_en_es, mod_en_es)
-    # spanish -> english
-    tok_es_en, mod_es_en = load_translation_model("es", "en")
-    back_translated = translate(spanish_text, tok_es_en, mod_es_en)
-
-    return back_translated
+def back_translate_en_ru_en(texts):
+    return back_translate(texts, "ru")
 
 '''
-Back-translate sentence (eng->japanese->en).
+Back-translate sentences (eng->chinese->en).
 '''
-def back_translate_en_ja_en(text):
-    # english -> japanese
-    tok_en_ja, mod_en_ja = load_translation_model("en", "ja")
-    japanese_text = translate(text, tok_en_ja, mod_en_ja)
-    # japanese -> english
-    tok_ja_en, mod_ja_en = load_translation_model("ja", "en")
-    back_translated = translate(japanese_text, tok_ja_en, mod_ja_en)
-
-    return back_translated
+def back_translate_en_zh_en(texts):
+    return back_translate(texts, "zh")
 
 '''
-Back-translate sentence (eng->arabic->en).
+Back-translate sentences (eng->italian->en).
 '''
-def back_translate_en_ar_en(text):
-    # english -> arabic
-    tok_en_ar, mod_en_ar = load_translation_model("en", "ar")
-    arabic_text = translate(text, tok_en_ar, mod_en_ar)
-    # arabic -> english
-    tok_ar_en, mod_ar_en = load_translation_model("ar", "en")
-    back_translated = translate(arabic_text, tok_ar_en, mod_ar_en)
+def back_translate_en_it_en(texts):
+    return back_translate(texts, "it")
 
-    return back_translated
+'''
+Back-translate sentences (eng->spanish->en).
+'''
+def back_translate_en_es_en(texts):
+    return back_translate(texts, "es")
 
 '''
-Back-translate sentence (eng->portoguese->en).
+Back-translate sentences (eng->japanese->en).
 '''
-def back_translate_en_pt_en(text):
-    # english -> portoguese
-    tok_en_pt, mod_en_pt = load_translation_model("en", "pt")
-    portuguese_text = translate(text, tok_en_pt, mod_en_pt)
-    # portuguese -> english
-    tok_pt_en, mod_pt_en = load_translation_model("pt", "en")
-    back_translated = translate(portuguese_text, tok_pt_en, mod_pt_en)
+def back_translate_en_ja_en(texts):
+    return back_translate(texts, "ja")
 
-    return back_translated
+'''
+Back-translate sentences (eng->arabic->en).
+'''
+def back_translate_en_ar_en(texts):
+    return back_translate(texts, "ar")
 
 '''
-Back-translate sentence (eng->dutch->en).
+Back-translate sentences (eng->portoguese->en).
 '''
-def back_translate_en_nl_en(text):
-    # english -> dutch
-    tok_en_nl, mod_en_nl = load_translation_model("en", "nl")
-    dutch_text = translate(text, tok_en_nl, mod_en_nl)
-    # dutch -> english
-    tok_nl_en, mod_nl_en = load_translation_model("nl", "en")
-    back_translated = translate(dutch_text, tok_nl_en, mod_nl_en)
+def back_translate_en_pt_en(texts):
+    return back_translate(texts, "pt")
 
-    return back_translated
+'''
+Back-translate sentences (eng->dutch->en).
+'''
+def back_translate_en_nl_en(texts):
+    return back_translate(texts, "nl")
 
 '''
 Create new dataframe with back-translated messages.
@@ -170,46 +159,100 @@ Create new dataframe with back-translated messages.
 def create_bt_df(df, bt_func, lang_label):
     # model only accepts inputs <= 512
     df_bt = df[df['message'].str.len() <= 512].copy()
-    df_bt['message'] = df_bt['message'].apply(bt_func)
+    # all messages at once (batched translation)
+    df_bt['message'] = bt_func(df_bt['message'].tolist())
     df_bt['bt_lang'] = lang_label  # track which language was used
     return df_bt
 
+'''
+Set up the translation in the current process (main process or worker): memory budget of the model registry,
+batch size, translation cache (None: in memory only) and number of torch threads (None: torch's default).
+'''
+def configure(max_bytes, max_batch_tokens, cache_path, threads):
+    global cache, batch_tokens
+    registry.max_bytes = max_bytes
+    batch_tokens = max_batch_tokens
+    if cache_path:
+        cache = TranslationCache(cache_path)
+    if threads:
+        torch.set_num_threads(threads)
+
 '''
 Augment new dataframes.
+With workers > 0 the back-translations run in parallel processes (one pivot language per task), every worker loads
+its own models and gets an equal share of the CPU threads. The data frames are put together in the same order as without workers.
+legacy_pivots=True reproduces the older augmented classes, where es/ja/ar/pt/nl were back-translated via Italian.
 '''
-def augment_df(in_df, out_csv):
+def augment_df(in_df, out_csv, workers=0, cache_path=None, legacy_pivots=False):
     # get original data frame
     original_df = in_df.copy()
     original_df['bt_lang'] = 'en'  # optional tag
 
+    # back-translation function and language label of all back-translated data frames
+    pivots = [
+        (back_translate_en_de_en, 'de'),
+        (back_translate_en_fr_en, 'fr'),
+        (back_translate_en_ru_en, 'ru'),
+        (back_translate_en_zh_en, 'zh'),
+        (back_translate_en_it_en, 'it'),
+        (back_translate_en_es_en, 'es'),
+        (back_translate_en_ja_en, 'ja'),
+        (back_translate_en_ar_en, 'ar'),
+        (back_translate_en_pt_en, 'pt'),
+        (back_translate_en_nl_en, 'nl'),
+    ]
+    if legacy_pivots:
+        # older runs: the last five labels were Italian back-translations
+        pivots = pivots[:5] + [(back_translate_en_it_en, lang_label) for _, lang_label in pivots[5:]]
+    tasks = [(in_df, bt_func, lang_label) for bt_func, lang_label in pivots]
+
     # get all back-translated data frames
-    bt_ger_df = create_bt_df(in_df, back_translate_en_de_en, 'de')
-    bt_fr_df  = create_bt_df(in_df, back_translate_en_fr_en, 'fr')
-    bt_ru_df  = create_bt_df(in_df, back_translate_en_ru_en, 'ru')
-    bt_zh_df  = create_bt_df(in_df, back_translate_en_zh_en, 'zh')
-    bt_it_df  = create_bt_df(in_df, back_translate_en_it_en, 'it')
-    bt_es_df  = create_bt_df(in_df, back_translate_en_it_en, 'es')
-    bt_ja_df  = create_bt_df(in_df, back_translate_en_it_en, 'ja')
-    bt_ar_df  = create_bt_df(in_df, back_translate_en_it_en, 'ar')
-    bt_pt_df  = create_bt_df(in_df, back_translate_en_it_en, 'pt')
-    bt_nl_df  = create_bt_df(in_df, back_translate_en_it_en, 'nl')
+    if workers > 0:
+        workers = min(workers, len(tasks))
+        # divide the threads of this process among the workers
+        threads = max(1, torch.get_num_threads() // workers)
+        # "spawn": fresh processes (torch does not work well in forked processes)
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(workers, initializer=configure,
+                          initargs=(registry.max_bytes, batch_tokens, cache_path, threads)) as pool:
+            bt_dfs = pool.starmap(create_bt_df, tasks, chunksize=1)
+    else:
+        bt_dfs = [create_bt_df(*task) for task in tasks]
 
     # concat all into one data frame
-    augmented_df = pd.concat([
-        original_df,
-        bt_ger_df,
-        bt_fr_df,
-        bt_ru_df,
-        bt_zh_df,
-        bt_it_df,
-        bt_es_df,
-        bt_ja_df,
-        bt_ar_df,
-        bt_pt_df,
-        bt_nl_df
-    ], ignore_index=True)
+    augmented_df = pd.concat([original_df] + bt_dfs, ignore_index=True)
     # save as new file
     augmented_df.to_csv(out_csv, index=False)
 
-# augment the data
-augment_df(class_to_augment_df,sys.argv[3])
+def main():
+    parser = argparse.ArgumentParser(description="Create synthetic items of a minority class via back-translation.")
+    parser.add_argument("train_csv", help="Raw train csv file (e.g. BERT/annotation_round1/raw/train.csv)")
+    parser.add_argument("class_to_augment", help="Name of the class to augment (e.g. music_ref)")
+    parser.add_argument("out_csv", help="Output csv of the augmented class")
+    parser.add_argument("--memory-budget", type=float, default=MEMORY_BUDGET / 1024 ** 3,
+                        help="Memory (in GB) the loaded translation models may use. Default: %(default)s")
+    parser.add_argument("--max-batch-tokens", type=int, default=MAX_BATCH_TOKENS,
+                        help="Padded tokens per translation batch. Default: %(default)s")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads used by torch. Default: torch's default")
+    parser.add_argument("--cache", default=TRANSLATION_CACHE, help="Translation cache file. Default: %(default)s")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the translation cache")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Processes that back-translate the pivot languages in parallel. Default: 0 (no pool)")
+    parser.add_argument("--legacy-pivots", action="store_true",
+                        help="Back-translate es/ja/ar/pt/nl via Italian, like the older augmented classes")
+    args = parser.parse_args()
+    cache_path = None if args.no_cache else args.cache
+    configure(int(args.memory_budget * 1024 ** 3), args.max_batch_tokens, cache_path, args.threads)
+
+    # get the original data frame to extract minority class
+    df = pd.read_csv(args.train_csv)
+
+    # seperate classes, keeping all of their label-annotations 
+    class_to_augment_df = df[df[args.class_to_augment].isin(['X', 'x'])]
+
+    # augment the data
+    augment_df(class_to_augment_df, args.out_csv, workers=args.workers, cache_path=cache_path, legacy_pivots=args.legacy_pivots)
+
+if __name__ == "__main__":
+    main()
+
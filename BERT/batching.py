@@ -0,0 +1,23 @@
+"""
+Length-bucketed batching of tokenized messages (used by add_synthetic_items.py and predict.py).
+Messages are sorted by token length and grouped so that the padded size of a batch (batch size x longest message)
+stays within a token budget: many short messages or few long ones per batch, with little padding.
+"""
+
+'''
+Group positions (sorted by token length) into buckets whose padded size stays within max_tokens.
+Returns lists of positions; a message longer than max_tokens gets a bucket of its own.
+'''
+def length_buckets(lengths, max_tokens):
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    buckets = []
+    bucket = []
+    for i in order:
+        # sorted by length -> the current message is the longest of the bucket
+        if bucket and (len(bucket) + 1) * lengths[i] > max_tokens:
+            buckets.append(bucket)
+            bucket = []
+        bucket.append(i)
+    if bucket:
+        buckets.append(bucket)
+    return buckets
@@ -0,0 +1,165 @@
+"""
+Exports a trained model (checkpoint directory of train_model.py) for faster CPU inference with predict.py:
+- "model_int8.pt": state dict of the dynamically int8-quantized model (Linear layers with int8 weights)
+- "model.onnx": ONNX graph of the fp32 model (dynamic batch size and sequence length), run with onnxruntime
+Tokenizer and config are saved next to them, so the export directory can be passed to predict.py (--backend int8/onnx).
+With a dataset dict, the exported backends are compared to the fp32 model on its test split:
+difference of the probabilities, agreement of the labels, rows/sec, peak resident memory and size of the model file
+("report.csv" in the export directory). The script exits with an error if a backend exceeds the tolerances.
+"""
+import os
+import io
+import sys
+import inspect
+import time
+import resource
+import multiprocessing
+import argparse
+import numpy as np
+import pandas as pd
+import torch
+from datasets import load_from_disk
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
+from predict import Predictor, INT8_FILE, ONNX_FILE
+
+# ONNX opset used for the export
+OPSET = 14
+# largest allowed difference to the fp32 probabilities and smallest share of identical labels (per backend)
+MAX_ABS_DIFF = 0.1
+MIN_LABEL_AGREEMENT = 0.98
+
+'''
+Save the dynamically quantized version of an fp32 model.
+'''
+def export_int8(model, out_dir):
+    # same quantization as quantized_model (predict.py), so the state dict fits when loading
+    quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    torch.save(quantized.state_dict(), os.path.join(out_dir, INT8_FILE))
+
+'''
+Export an fp32 model as ONNX graph (inputs of the tokenizer, output "logits").
+The inputs are passed by position in the order of model.forward (input_ids, attention_mask, token_type_ids for BERT),
+which is not the key order of the tokenizer, so the input names of the graph belong to the right tensors.
+'''
+def export_onnx(model, tokenizer, out_dir):
+    example = tokenizer(["Let me enjoy this great concert!"], return_tensors="pt")
+    params = list(inspect.signature(model.forward).parameters)
+    input_names = [name for name in params if name in example]
+    # positional arguments only work if the inputs are the first parameters of forward
+    if input_names != params[:len(input_names)] or len(input_names) != len(example):
+        raise ValueError(f"Tokenizer outputs {list(example.keys())} do not fit the first parameters of forward {params}")
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["logits"] = {0: "batch"}
+    torch.onnx.export(
+        model,
+        tuple(example[name] for name in input_names),
+        os.path.join(out_dir, ONNX_FILE),
+        input_names=input_names,
+        output_names=["logits"],
+        dynamic_axes=dynamic_axes,
+        opset_version=OPSET,
+    )
+
+'''
+Helper: size of a backend's model file in MB (serialized weights, or the ONNX file).
+'''
+def model_size_mb(predictor, out_dir):
+    if predictor.backend == "onnx":
+        return os.path.getsize(os.path.join(out_dir, ONNX_FILE)) / 1024 ** 2
+    buffer = io.BytesIO()
+    torch.save(predictor.model.state_dict(), buffer)
+    return buffer.tell() / 1024 ** 2
+
+'''
+Helper: highest resident memory (RSS) of the current process so far in MB (ru_maxrss is in bytes on macOS, in KB on Linux).
+'''
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+'''
+Helper: predict the messages with one backend (runs in its own process, so the peak memory belongs to this backend only).
+Returns the probabilities, the time of the prediction in seconds, the peak RSS and the model size in MB.
+'''
+def measure_backend(backend, model_dir, out_dir, messages, threads=None):
+    # a spawned process starts with torch's default number of threads
+    if threads:
+        torch.set_num_threads(threads)
+    predictor = Predictor(model_dir, backend=backend)
+    # warm up (first batches are slower)
+    predictor.predict(messages[:32])
+    start = time.perf_counter()
+    probs = predictor.predict(messages)
+    elapsed = time.perf_counter() - start
+    return probs, elapsed, peak_rss_mb(), model_size_mb(predictor, out_dir)
+
+'''
+Compare the exported backends to the fp32 model on the messages of the test split.
+Every backend runs in a fresh process. Returns one row per backend: max/mean absolute difference of the probabilities,
+share of identical labels, rows/sec, peak resident memory of the process and size of the model file.
+'''
+def compare_backends(checkpoint, out_dir, messages, threshold=0.5, threads=None):
+    rows = []
+    reference = None
+    context = multiprocessing.get_context("spawn")
+    for backend in ["torch", "int8", "onnx"]:
+        model_dir = checkpoint if backend == "torch" else out_dir
+        with context.Pool(1) as pool:
+            probs, elapsed, peak_rss, size = pool.apply(measure_backend, (backend, model_dir, out_dir, messages, threads))
+        if reference is None:
+            reference = probs
+        diff = np.abs(probs - reference)
+        rows.append({
+            "backend": backend,
+            "max_abs_diff": float(diff.max()),
+            "mean_abs_diff": float(diff.mean()),
+            "label_agreement": float(((probs >= threshold) == (reference >= threshold)).mean()),
+            "rows_per_sec": len(messages) / elapsed,
+            "peak_rss_mb": peak_rss,
+            "file_size_mb": size,
+        })
+    return pd.DataFrame(rows)
+
+'''
+Helper: backends of a report that differ too much from fp32.
+'''
+def failed_backends(report, max_abs_diff=MAX_ABS_DIFF, min_label_agreement=MIN_LABEL_AGREEMENT):
+    failed = report[(report["max_abs_diff"] > max_abs_diff) | (report["label_agreement"] < min_label_agreement)]
+    return failed["backend"].tolist()
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a trained model as int8-quantized torch model and as ONNX graph.")
+    parser.add_argument("checkpoint", help="Model directory (e.g. BERT/annotation_round1/models/bert-finetuned_concert_syn10/checkpoint-500)")
+    parser.add_argument("out_dir", help="Export directory")
+    parser.add_argument("--dataset", help="Dataset dict whose test split is used to compare the backends to fp32 (e.g. BERT/annotation_round1/dataset_dict_synth_10)")
+    parser.add_argument("--max-abs-diff", type=float, default=MAX_ABS_DIFF, help="Largest allowed difference to the fp32 probabilities. Default: %(default)s")
+    parser.add_argument("--min-label-agreement", type=float, default=MIN_LABEL_AGREEMENT, help="Smallest allowed share of labels identical to fp32. Default: %(default)s")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads used by torch. Default: torch's default")
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(args.checkpoint)
+    model = AutoModelForSequenceClassification.from_pretrained(args.checkpoint)
+    model.eval()
+    # tokenizer and config (incl. id2label) are needed to load the exported models
+    tokenizer.save_pretrained(args.out_dir)
+    model.config.save_pretrained(args.out_dir)
+
+    export_int8(model, args.out_dir)
+    export_onnx(model, tokenizer, args.out_dir)
+    print(f"Exported {INT8_FILE} and {ONNX_FILE} to {args.out_dir}")
+
+    if args.dataset:
+        messages = load_from_disk(args.dataset)["test"]["message"]
+        report = compare_backends(args.checkpoint, args.out_dir, messages, threads=args.threads)
+        print(report.to_string(index=False))
+        report.to_csv(os.path.join(args.out_dir, "report.csv"), index=False)
+        failed = failed_backends(report, args.max_abs_diff, args.min_label_agreement)
+        if failed:
+            sys.exit(f"Backends {', '.join(failed)} differ too much from fp32 "
+                     f"(max_abs_diff > {args.max_abs_diff} or label_agreement < {args.min_label_agreement})")
+
+if __name__ == "__main__":
+    main()
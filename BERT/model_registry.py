@@ -0,0 +1,56 @@
+"""
+Keeps loaded translation models (MarianMT tokenizer/model pairs) in memory, so every model is loaded from disk only once.
+Models are kept in least-recently-used order; when loading a new model would exceed the memory budget,
+the models that were not used for the longest time are dropped first (the newest model is always kept).
+"""
+from collections import OrderedDict
+
+# default memory budget in bytes (one opus-mt model needs ~300 MB in fp32, so ~6 models fit)
+MEMORY_BUDGET = 2 * 1024 ** 3
+
+'''
+Helper: memory used by the weights (parameters and buffers) of a torch model in bytes.
+'''
+def model_bytes(model):
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+class ModelRegistry:
+    '''
+    loader(key) returns (tokenizer, model) for a key (e.g. ("en", "de")).
+    '''
+    def __init__(self, loader, max_bytes=MEMORY_BUDGET):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        # key -> (tokenizer, model, size in bytes), least recently used first
+        self.models = OrderedDict()
+        self.loads = 0
+
+    '''
+    Memory used by all resident models in bytes.
+    '''
+    def used_bytes(self):
+        return sum(size for _, _, size in self.models.values())
+
+    '''
+    Get the (tokenizer, model) of a key. Loads it on first use, drops old models if the budget is exceeded.
+    '''
+    def get(self, key):
+        if key in self.models:
+            self.models.move_to_end(key)
+            tokenizer, model, _ = self.models[key]
+            return tokenizer, model
+
+        tokenizer, model = self.loader(key)
+        self.loads += 1
+        self.models[key] = (tokenizer, model, model_bytes(model))
+        # evict least recently used models (never the one just loaded)
+        while len(self.models) > 1 and self.used_bytes() > self.max_bytes:
+            self.models.popitem(last=False)
+        return tokenizer, model
+
+    '''
+    Drop all resident models.
+    '''
+    def clear(self):
+        self.models.clear()
@@ -0,0 +1,218 @@
+"""
+Labels comments with a trained model (checkpoint directory of train_model.py).
+The model is loaded once, the input (csv or Parquet file, or a directory -> every "comments.csv" below it, e.g. comments_live)
+is read in chunks, and the messages of a chunk are predicted in length-sorted batches.
+Output (csv or Parquet, by the file extension): the input columns, one probability column per label ("prob_<label>")
+and one 0/1 column per label (probability >= threshold), named after the model's id2label mapping.
+"""
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import torch
+from transformers import AutoConfig, AutoTokenizer, AutoModelForSequenceClassification
+from batching import length_buckets
+# shared chunk writer (repository root)
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chunk_writer import ChunkWriter, string_array, is_parquet
+
+# padded tokens per forward pass (batch size x longest message of the batch)
+MAX_BATCH_TOKENS = 8192
+# same truncation as in training
+MAX_LENGTH = 128
+# rows read (and written) at once
+CHUNKSIZE = 50000
+
+# file names of the exported models (export_model.py)
+INT8_FILE = "model_int8.pt"
+ONNX_FILE = "model.onnx"
+BACKENDS = ["torch", "int8", "onnx"]
+
+'''
+Helper: fp32 model (architecture from the config, no weights) turned into its dynamically quantized version.
+'''
+def quantized_model(config):
+    model = AutoModelForSequenceClassification.from_config(config)
+    model.eval()
+    # Linear layers with int8 weights, activations are quantized on the fly
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+'''
+Load the int8 model of an export directory (config + quantized state dict).
+'''
+def load_int8_model(export_dir):
+    model = quantized_model(AutoConfig.from_pretrained(export_dir))
+    model.load_state_dict(torch.load(os.path.join(export_dir, INT8_FILE)))
+    return model
+
+class Predictor:
+    '''
+    Loads tokenizer and model of a checkpoint once and predicts the label probabilities of messages.
+    backend: "torch" (fp32 checkpoint of train_model.py), "int8" (dynamically quantized) or "onnx" (onnxruntime);
+    the last two expect the output directory of export_model.py.
+    '''
+    def __init__(self, checkpoint, max_batch_tokens=MAX_BATCH_TOKENS, backend="torch"):
+        self.tokenizer = AutoTokenizer.from_pretrained(checkpoint)
+        self.backend = backend
+        if backend == "torch":
+            self.model = AutoModelForSequenceClassification.from_pretrained(checkpoint)
+            self.model.eval()
+            config = self.model.config
+        elif backend == "int8":
+            self.model = load_int8_model(checkpoint)
+            config = self.model.config
+        elif backend == "onnx":
+            import onnxruntime
+            self.session = onnxruntime.InferenceSession(os.path.join(checkpoint, ONNX_FILE), providers=["CPUExecutionProvider"])
+            self.input_names = [node.name for node in self.session.get_inputs()]
+            config = AutoConfig.from_pretrained(checkpoint)
+        else:
+            raise ValueError(f"Unknown backend {backend} (choose from {', '.join(BACKENDS)})")
+        self.max_batch_tokens = max_batch_tokens
+        # label names in the order of the model outputs
+        id2label = config.id2label
+        self.labels = [id2label[idx] for idx in range(len(id2label))]
+
+    '''
+    Logits of one padded batch (dict of tensors) as numpy array.
+    '''
+    def logits(self, batch):
+        if self.backend == "onnx":
+            inputs = {name: batch[name].numpy() for name in self.input_names}
+            return self.session.run(["logits"], inputs)[0]
+        with torch.inference_mode():
+            return self.model(**batch).logits.float().numpy()
+
+    '''
+    Probabilities (n x labels) of many messages, in the order of the messages.
+    '''
+    def predict(self, texts):
+        encodings = self.tokenizer(list(texts), truncation=True, max_length=MAX_LENGTH)
+        lengths = [len(ids) for ids in encodings["input_ids"]]
+        probs = np.zeros((len(lengths), len(self.labels)), dtype=np.float32)
+        for bucket in length_buckets(lengths, self.max_batch_tokens):
+            features = [{key: values[i] for key, values in encodings.items()} for i in bucket]
+            batch = self.tokenizer.pad(features, return_tensors="pt")
+            logits = self.logits(batch)
+            # sigmoid per label (multi-label)
+            probs[bucket] = 1 / (1 + np.exp(-logits))
+        return probs
+
+'''
+Helper: "comments.csv" files below a directory (with the folder name, e.g. the video ID).
+'''
+def comment_files(in_dir):
+    for root, _, files in sorted(os.walk(in_dir)):
+        if "comments.csv" in files:
+            yield os.path.join(root, "comments.csv"), os.path.basename(root)
+
+'''
+Read the input in chunks of data frames. A directory is searched for "comments.csv" files (the folder name,
+e.g. the video ID, is added as column "video_id").
+'''
+def read_chunks(in_path, chunksize=CHUNKSIZE):
+    if os.path.isdir(in_path):
+        for csv_path, video_id in comment_files(in_path):
+            for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+                chunk.insert(0, "video_id", video_id)
+                yield chunk
+    elif is_parquet(in_path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(in_path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(in_path, chunksize=chunksize)
+
+'''
+Columns of the input (only the headers are read). For a directory: "video_id" and all columns of all its
+"comments.csv" files, in the order they first appear.
+'''
+def input_columns(in_path):
+    if os.path.isdir(in_path):
+        columns = {"video_id": None}
+        for csv_path, _ in comment_files(in_path):
+            columns.update(dict.fromkeys(pd.read_csv(csv_path, nrows=0).columns))
+        return list(columns)
+    if is_parquet(in_path):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(in_path).schema_arrow.names
+    return list(pd.read_csv(in_path, nrows=0).columns)
+
+'''
+Writes the predictions chunk by chunk (csv: header only once, Parquet: one row group per chunk, see chunk_writer.py).
+Every chunk gets the same columns: the input columns (a file without one of them gets empty cells), then the
+probabilities and the 0/1 labels. The Parquet schema is fixed up front: input columns as (nullable) strings,
+probabilities as float32 and labels as int8, so empty columns or files with other columns do not change it.
+'''
+class PredictionWriter(ChunkWriter):
+    def __init__(self, out_path, columns, labels):
+        import pyarrow as pa
+        self.prob_cols = [f"prob_{label}" for label in labels]
+        self.label_cols = list(labels)
+        # input columns named like a label (e.g. an annotated file) are replaced by the prediction
+        self.input_cols = [col for col in columns if col not in self.prob_cols + self.label_cols]
+        schema = None
+        if is_parquet(out_path):
+            schema = pa.schema([(col, pa.string()) for col in self.input_cols]
+                               + [(col, pa.float32()) for col in self.prob_cols]
+                               + [(col, pa.int8()) for col in self.label_cols])
+        super().__init__(out_path, schema=schema)
+
+    def to_arrow(self, df):
+        import pyarrow as pa
+        arrays = [string_array(df[col]) for col in self.input_cols]
+        arrays += [pa.array(df[col].to_numpy(), type=pa.float32()) for col in self.prob_cols]
+        arrays += [pa.array(df[col].to_numpy(), type=pa.int8()) for col in self.label_cols]
+        return pa.Table.from_arrays(arrays, schema=self.schema)
+
+    def write(self, df):
+        super().write(df.reindex(columns=self.input_cols + self.prob_cols + self.label_cols))
+
+'''
+Predict all messages of in_path and write them with probabilities and labels to out_path.
+Returns the number of rows.
+'''
+def run_prediction(predictor, in_path, out_path, text_col="message", threshold=0.5, chunksize=CHUNKSIZE):
+    n_rows = 0
+    start = time.perf_counter()
+    with PredictionWriter(out_path, input_columns(in_path), predictor.labels) as writer:
+        for chunk in read_chunks(in_path, chunksize):
+            probs = predictor.predict(chunk[text_col].fillna("").astype(str))
+            for idx, label in enumerate(predictor.labels):
+                chunk[f"prob_{label}"] = probs[:, idx]
+            for idx, label in enumerate(predictor.labels):
+                chunk[label] = (probs[:, idx] >= threshold).astype(np.int8)
+            writer.write(chunk)
+
+            n_rows += len(chunk)
+            elapsed = time.perf_counter() - start
+            print(f"{n_rows} rows, {n_rows / elapsed:.0f} rows/sec")
+    return n_rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Label comments with a trained model.")
+    parser.add_argument("checkpoint", help="Model directory (e.g. BERT/annotation_round1/models/bert-finetuned_concert_syn10/checkpoint-500), or export directory for --backend int8/onnx")
+    parser.add_argument("in_path", help="csv/Parquet file, or directory with comments.csv files (e.g. comments_live)")
+    parser.add_argument("out_path", help="Output file (.csv or .parquet)")
+    parser.add_argument("--text-col", default="message", help="Column with the messages. Default: %(default)s")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Probability from which a label is set. Default: %(default)s")
+    parser.add_argument("--max-batch-tokens", type=int, default=MAX_BATCH_TOKENS, help="Padded tokens per batch. Default: %(default)s")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE, help="Rows read at once. Default: %(default)s")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads used by torch. Default: torch's default")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                        help="torch: fp32 checkpoint; int8/onnx: output directory of export_model.py. Default: %(default)s")
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    predictor = Predictor(args.checkpoint, max_batch_tokens=args.max_batch_tokens, backend=args.backend)
+    start = time.perf_counter()
+    n_rows = run_prediction(predictor, args.in_path, args.out_path, args.text_col, args.threshold, args.chunksize)
+    elapsed = time.perf_counter() - start
+    print(f"Predicted {n_rows} rows in {elapsed:.1f}s ({n_rows / max(elapsed, 1e-9):.0f} rows/sec), saved to {args.out_path}")
+
+if __name__ == "__main__":
+    main()
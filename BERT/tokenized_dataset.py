@@ -0,0 +1,90 @@
+"""
+Pre-tokenization of a "dataset_dict_x" directory for train_model.py.
+The messages are tokenized once (truncated, but NOT padded) and the token IDs are stored as Arrow dataset next to
+the dataset dict ("dataset_dict_x_tokenized_<key>"). The key is a hash of the tokenizer and of the dataset's fingerprint,
+so a different tokenizer or new data gets a new directory, and the next trainings load the token IDs from disk.
+Padding happens per batch during training (dynamic padding), so short live-chat messages are not padded to 128 tokens.
+"""
+import os
+import sys
+import hashlib
+import numpy as np
+from datasets import load_from_disk
+from transformers import AutoTokenizer
+
+# label columns (same order as in train_model.py)
+LABELS = ["feeling_pos", "feeling_neg", "music_ref", "external_ref", "phys_react"]
+# longer messages are truncated
+MAX_LENGTH = 128
+
+'''
+Hash of everything that changes the token IDs of a tokenizer (vocabulary, normalization, special tokens).
+'''
+def tokenizer_hash(tokenizer):
+    h = hashlib.sha256(type(tokenizer).__name__.encode())
+    if getattr(tokenizer, "is_fast", False):
+        # full serialization of the fast tokenizer
+        h.update(tokenizer.backend_tokenizer.to_str().encode())
+    else:
+        h.update(str(sorted(tokenizer.get_vocab().items())).encode())
+    h.update(str(sorted(tokenizer.special_tokens_map.items())).encode())
+    h.update(str(MAX_LENGTH).encode())
+    return h.hexdigest()
+
+'''
+Helper: directory of the tokenized dataset of a dataset dict.
+'''
+def tokenized_path(dataset_path, dataset, tokenizer):
+    h = hashlib.sha256(tokenizer_hash(tokenizer).encode())
+    for split in sorted(dataset):
+        h.update(f"{split}:{dataset[split]._fingerprint}".encode())
+    return f"{os.path.normpath(dataset_path)}_tokenized_{h.hexdigest()[:16]}"
+
+'''
+Preprocess data for training (token IDs without padding, label vector and length for length-grouped batches).
+'''
+def preprocess_data(examples, tokenizer, labels=LABELS):
+    # take a batch of texts
+    text = examples["message"]
+    # encode them
+    encoding = tokenizer(text, truncation=True, max_length=MAX_LENGTH)
+    # add labels
+    labels_batch = {k: examples[k] for k in examples.keys() if k in labels}
+    # create numpy array of shape (batch_size, num_labels)
+    labels_matrix = np.zeros((len(text), len(labels)))
+    # fill numpy array
+    for idx, label in enumerate(labels):
+        if label in labels_batch:
+            labels_matrix[:, idx] = labels_batch[label]
+        else:
+            print(f"Label {label} not found in batch!")
+
+    encoding["labels"] = labels_matrix.tolist()
+    encoding["length"] = [len(ids) for ids in encoding["input_ids"]]
+    return encoding
+
+'''
+Load the tokenized version of a dataset dict, tokenize (and store) it first if there is none for this tokenizer yet.
+'''
+def load_tokenized(dataset_path, tokenizer, labels=LABELS):
+    dataset = load_from_disk(dataset_path)
+    out_path = tokenized_path(dataset_path, dataset, tokenizer)
+    if os.path.isdir(out_path):
+        return load_from_disk(out_path)
+
+    encoded_dataset = dataset.map(preprocess_data, batched=True, fn_kwargs={"tokenizer": tokenizer, "labels": labels},
+                                  remove_columns=dataset['train'].column_names)
+    encoded_dataset.save_to_disk(out_path)
+    print(f"Tokenized dataset saved to {out_path}")
+    return encoded_dataset
+
+def main():
+    # pass dataset (dict) and optionally the tokenizer (default: bert-base-cased)
+    dataset_path = sys.argv[1]
+    model_name = sys.argv[2] if len(sys.argv) > 2 else "bert-base-cased"
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    encoded_dataset = load_tokenized(dataset_path, tokenizer)
+    print(encoded_dataset)
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,16 @@ Train BERT on multi-label classification for: "feeling_pos", "feeling_neg", "mus
 Tutorial for multi-label classification used: https://colab.research.google.com/github/NielsRogge/Transformers-Tutorials/blob/master/BERT/Fine_tuning_BERT_(and_friends)_for_multi_label_text_classification.ipynb#scrollTo=KOBosj4UL2tU
 """
 
-from transformers import AutoTokenizer, AutoModelForSequenceClassification, TrainingArguments, Trainer
+from transformers import AutoTokenizer, AutoModelForSequenceClassification, TrainingArguments, Trainer, DataCollatorWithPadding
 import numpy as np
-from datasets import load_from_disk
+from tokenized_dataset import load_tokenized
 from sklearn.metrics import f1_score, roc_auc_score, accuracy_score
 from transformers import EvalPrediction
 import torch
 import sys
 
 # pass dataset (dict)
-dataset = load_from_disk(sys.argv[1])
+dataset_path = sys.argv[1]
 out_dir_model = sys.argv[2]
 
 
@@ -24,30 +24,8 @@ label2id = {label:idx for idx, label in enumerate(labels)}
 # get tokanizer
 tokenizer = AutoTokenizer.from_pretrained("bert-base-cased")
 
-'''
-Preprocess data for training.
-'''
-def preprocess_data(examples):
-  # take a batch of texts
-  text = examples["message"]
-  # encode them
-  encoding = tokenizer(text, padding="max_length", truncation=True, max_length=128)
-  # add labels
-  labels_batch = {k: examples[k] for k in examples.keys() if k in labels}
-  # create numpy array of shape (batch_size, num_labels)
-  labels_matrix = np.zeros((len(text), len(labels)))
-  # fill numpy array
-  for idx, label in enumerate(labels):
-    if label in labels_batch:
-        labels_matrix[:, idx] = labels_batch[label]
-    else:
-        print(f"Label {label} not found in batch!")
-
-  encoding["labels"] = labels_matrix.tolist()
-  
-  return encoding
-
-encoded_dataset = dataset.map(preprocess_data, batched=True, remove_columns=dataset['train'].column_names)
+# token IDs (unpadded) are stored next to the dataset dict and only computed if the tokenizer or the data changed
+encoded_dataset = load_tokenized(dataset_path, tokenizer, labels)
 encoded_dataset.set_format("torch")
 
 # choose model
@@ -73,6 +51,8 @@ args = TrainingArguments(
     weight_decay=0.01,
     load_best_model_at_end=True,
     metric_for_best_model=metric_name,
+    # batches of messages with similar length (little padding)
+    group_by_length=True,
     #push_to_hub=True,
 )
 
@@ -133,7 +113,7 @@ def compute_metrics(p: EvalPrediction):
     return result
 
 # forward pass
-outputs = model(input_ids=encoded_dataset['train']['input_ids'][0].unsqueeze(0), labels=encoded_dataset['train'][0]['labels'].unsqueeze(0))
+outputs = model(input_ids=encoded_dataset['train'][0]['input_ids'].unsqueeze(0), labels=encoded_dataset['train'][0]['labels'].unsqueeze(0))
 
 # initialize trainer
 trainer = Trainer(
@@ -142,6 +122,8 @@ trainer = Trainer(
     train_dataset=encoded_dataset["train"],
     eval_dataset=encoded_dataset["test"],
     tokenizer=tokenizer,
+    # pad every batch only to its longest message
+    data_collator=DataCollatorWithPadding(tokenizer),
     compute_metrics=compute_metrics
 )
 
@@ -0,0 +1,69 @@
+"""
+Persistent cache of translations (used by add_synthetic_items.py).
+Every translation is stored in a sqlite file, keyed by the model (e.g. "Helsinki-NLP/opus-mt-en-de"),
+the generation parameters and the normalized text. A message that was already translated by the same model with
+the same parameters (in an earlier run, for another class or in another trial) is therefore never translated again.
+"""
+import os
+import json
+import sqlite3
+
+# default location of the cache (relative to the repository root)
+TRANSLATION_CACHE = ".cache/translations.sqlite"
+# sqlite limits the number of parameters per query
+QUERY_BLOCK = 500
+
+'''
+Helper: the text that is translated (and used as cache key) for a message.
+'''
+def normalize(text):
+    return str(text).strip()
+
+'''
+Helper: key of the generation parameters of a model (everything that changes the output of generate).
+'''
+def generation_key(model, **params):
+    config = model.generation_config.to_dict()
+    # the library version is stored in the config, but does not change the output
+    config.pop("transformers_version", None)
+    config.update(params)
+    return json.dumps(config, sort_keys=True, default=str)
+
+class TranslationCache:
+    '''
+    Pass path=None to only cache in memory (nothing is written to disk).
+    '''
+    def __init__(self, path=TRANSLATION_CACHE):
+        self.path = path
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # several processes may write to the same file -> wait for locks instead of failing
+        self.con = sqlite3.connect(path or ":memory:", timeout=60)
+        self.con.execute("CREATE TABLE IF NOT EXISTS translations (model TEXT, params TEXT, text TEXT, translation TEXT, "
+                         "PRIMARY KEY (model, params, text))")
+
+    '''
+    Look up many texts. Returns a dict text -> translation of the ones that are cached.
+    '''
+    def get_many(self, model, params, texts):
+        found = {}
+        texts = list(texts)
+        for start in range(0, len(texts), QUERY_BLOCK):
+            block = texts[start:start + QUERY_BLOCK]
+            rows = self.con.execute(
+                f"SELECT text, translation FROM translations WHERE model = ? AND params = ? AND text IN ({','.join('?' * len(block))})",
+                [model, params] + block,
+            )
+            found.update(rows)
+        return found
+
+    '''
+    Store translations (dict text -> translation).
+    '''
+    def put_many(self, model, params, translations):
+        with self.con:
+            self.con.executemany("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?)",
+                                 [(model, params, text, translation) for text, translation in translations.items()])
+
+    def close(self):
+        self.con.close()
@@ -0,0 +1,205 @@
+"""
+Agreement of N annotators (joined annotated files) in a multi-label setting, with bootstrap confidence intervals.
+The tables are aligned on the comment ID, then every metric is computed from per-item statistics:
+- pairwise cohen's kappa (per label and average) and average jaccard for every pair of annotators
+- fleiss' kappa per label (and average) over all annotators
+Every metric only depends on sums of per-item statistics, so a bootstrap resample is one row of a count matrix
+(how often each item was drawn, built from a resampled index matrix) multiplied with the statistics.
+The resamples are drawn in fixed-size blocks with their own seeds, so the result does not depend on the number of workers.
+"""
+import os
+import sys
+import argparse
+import itertools
+import multiprocessing
+import numpy as np
+import pandas as pd
+from calc_iaa import to_binary_matrix, kappa_from_counts
+from join_annotations import load_joined, check_concerts, KEY_COLS
+
+# default label columns (same as calc_iaa.py)
+LABEL_COLS = ["feeling_pos", "feeling_neg", "music_ref", "external_ref", "phys_react"]
+# resamples per block (one block = one task of the pool)
+BLOCK_SIZE = 250
+
+'''
+Helper: name of an annotator from the file name (e.g. "anno_lea_joined.csv" -> "anno_lea").
+'''
+def annotator_name(path):
+    return os.path.splitext(os.path.basename(path))[0].removesuffix("_joined")
+
+'''
+Align the tables of all annotators on the key columns (default: comment_id, joined tables with a concert key: concert and comment_id).
+The IDs restart in every concert of an older joined file (without concert key), so repeated keys are told apart by their occurrence
+(1st, 2nd, ... time the key appears in the file). Only items present in every table are kept.
+Returns the aligned keys (in the order of the first table) and one n x labels 0/1 matrix per annotator.
+'''
+def align_annotations(dfs, label_cols, key=("comment_id",)):
+    key = list(key)
+    indexed = []
+    for df in dfs:
+        df = df.reset_index(drop=True)
+        occurrence = df.groupby(key, sort=False).cumcount().rename("occurrence")
+        index = pd.MultiIndex.from_frame(pd.concat([df[key], occurrence], axis=1))
+        indexed.append((df, index))
+
+    # items every annotator has (in the order of the first table)
+    common = indexed[0][1]
+    for _, index in indexed[1:]:
+        common = common[common.isin(index)]
+
+    matrices = []
+    for df, index in indexed:
+        missing = len(index) - len(common)
+        if missing:
+            print(f"{missing} items of a table are not annotated by every annotator and are skipped")
+        positions = pd.Series(np.arange(len(index)), index=index)[common].to_numpy()
+        matrices.append(to_binary_matrix(df.iloc[positions], label_cols))
+    return common.to_frame(index=False), matrices
+
+'''
+Per-item statistics all metrics are computed from (one column per statistic, one row per item):
+- per pair and label: both 1 / only first 1 / only second 1 (confusion counts for cohen's kappa)
+- per pair: jaccard of the item
+- per label: number of annotators that gave the label and the item's fleiss agreement P_i
+'''
+def item_statistics(matrices):
+    n_raters = len(matrices)
+    columns = []
+    for a, b in itertools.combinations(matrices, 2):
+        a = a.astype(bool)
+        b = b.astype(bool)
+        columns += [a & b, a & ~b, ~a & b]
+        intersection = np.count_nonzero(a & b, axis=1)
+        union = np.count_nonzero(a | b, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columns.append(np.where(union == 0, 1.0, intersection / union)[:, None])
+
+    # raters per item and label that gave the label (1) / did not give it (0)
+    ones = np.sum(matrices, axis=0, dtype=np.int64)
+    zeros = n_raters - ones
+    agreement = (ones * ones + zeros * zeros - n_raters) / (n_raters * (n_raters - 1))
+    columns += [ones, agreement]
+    return np.hstack([np.asarray(c, dtype=np.float64).reshape(len(matrices[0]), -1) for c in columns])
+
+'''
+Compute all metrics from summed statistics (sums: ... x statistics, e.g. one row per resample).
+Returns a dict metric name -> array with one value per row of sums.
+'''
+def metrics_from_sums(sums, n_items, names, label_cols):
+    n_labels = len(label_cols)
+    metrics = {}
+    col = 0
+    for a, b in itertools.combinations(names, 2):
+        n_11 = sums[..., col:col + n_labels]
+        n_10 = sums[..., col + n_labels:col + 2 * n_labels]
+        n_01 = sums[..., col + 2 * n_labels:col + 3 * n_labels]
+        col += 3 * n_labels
+        kappas = kappa_from_counts(n_11, n_10, n_01, n_items)
+        for j, label in enumerate(label_cols):
+            metrics[f"kappa_{label} ({a}, {b})"] = kappas[..., j]
+        metrics[f"avg_kappa ({a}, {b})"] = kappas.mean(axis=-1)
+        metrics[f"avg_jaccard ({a}, {b})"] = sums[..., col] / n_items
+        col += 1
+
+    # fleiss' kappa per label
+    n_raters = len(names)
+    p_one = sums[..., col:col + n_labels] / (n_items * n_raters)
+    p_agree = sums[..., col + n_labels:col + 2 * n_labels] / n_items
+    p_expected = p_one * p_one + (1 - p_one) * (1 - p_one)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fleiss = (p_agree - p_expected) / (1 - p_expected)
+    for j, label in enumerate(label_cols):
+        metrics[f"fleiss_{label}"] = fleiss[..., j]
+    metrics["avg_fleiss"] = fleiss.mean(axis=-1)
+    return metrics
+
+# per-item statistics of the current worker process (set once, not sent with every block)
+worker_stats = None
+
+'''
+Helper: make the statistics available in a worker process.
+'''
+def set_statistics(stats):
+    global worker_stats
+    worker_stats = stats
+
+'''
+Helper: summed statistics of one block of resamples.
+The resampled index matrix (resamples x items) is turned into counts (how often each item was drawn).
+'''
+def resample_block(args):
+    seed, n_resamples = args
+    stats = worker_stats
+    n_items = stats.shape[0]
+    rng = np.random.default_rng(seed)
+    indices = rng.integers(0, n_items, size=(n_resamples, n_items))
+    # offset every row, so one bincount gives the counts of all resamples
+    offsets = np.arange(n_resamples)[:, None] * n_items
+    counts = np.bincount((indices + offsets).ravel(), minlength=n_resamples * n_items).reshape(n_resamples, n_items)
+    return counts.astype(np.float64) @ stats
+
+'''
+Agreement of all annotators with percentile bootstrap confidence intervals.
+n_resamples=0 skips the bootstrap; workers > 0 spreads the resamples over a pool of processes.
+Returns a data frame with one row per metric (estimate, ci_low, ci_high).
+'''
+def agreement(matrices, names, label_cols, n_resamples=1000, ci=95, seed=0, workers=0):
+    stats = item_statistics(matrices)
+    n_items = stats.shape[0]
+    estimates = metrics_from_sums(stats.sum(axis=0), n_items, names, label_cols)
+    result = pd.DataFrame({"metric": list(estimates), "estimate": [float(v) for v in estimates.values()]})
+    if not n_resamples:
+        return result
+
+    # fixed blocks with their own seeds -> same resamples for any number of workers
+    blocks = [min(BLOCK_SIZE, n_resamples - start) for start in range(0, n_resamples, BLOCK_SIZE)]
+    seeds = np.random.SeedSequence(seed).spawn(len(blocks))
+    tasks = list(zip(seeds, blocks))
+    if workers > 0:
+        with multiprocessing.Pool(workers, initializer=set_statistics, initargs=(stats,)) as pool:
+            sums = pool.map(resample_block, tasks)
+    else:
+        set_statistics(stats)
+        sums = [resample_block(task) for task in tasks]
+    resampled = metrics_from_sums(np.vstack(sums), n_items, names, label_cols)
+
+    # percentile intervals (resamples where a metric is undefined are ignored)
+    tail = (100 - ci) / 2
+    result["ci_low"] = [np.nanpercentile(v, tail) if not np.isnan(v).all() else np.nan for v in resampled.values()]
+    result["ci_high"] = [np.nanpercentile(v, 100 - tail) if not np.isnan(v).all() else np.nan for v in resampled.values()]
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Agreement of N annotators (joined annotated files) with bootstrap confidence intervals.")
+    parser.add_argument("files", nargs="+", help="Joined annotated files (csv or Parquet), one per annotator")
+    parser.add_argument("--labels", nargs="+", default=LABEL_COLS, help="Label columns. Default: " + " ".join(LABEL_COLS))
+    parser.add_argument("--bootstrap", type=int, default=1000, help="Number of bootstrap resamples (0: no intervals). Default: 1000")
+    parser.add_argument("--ci", type=float, default=95, help="Confidence level in percent. Default: 95")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the resampling. Default: 0")
+    parser.add_argument("--workers", type=int, default=0, help="Processes used for the resampling. Default: 0 (no pool)")
+    parser.add_argument("--out", help="Also save the results as csv")
+    args = parser.parse_args()
+    if len(args.files) < 2:
+        parser.error("at least two annotators are needed")
+
+    names = [annotator_name(path) for path in args.files]
+    dfs = [load_joined(path) for path in args.files]
+    # tables of join_annotations.py have a concert key next to the comment ID
+    key = KEY_COLS if all("concert" in df.columns for df in dfs) else ["comment_id"]
+    if key == KEY_COLS:
+        # match the concert keys of the annotators, stop if a concert is not in every table
+        try:
+            dfs = check_concerts(dfs, names)
+        except ValueError as e:
+            sys.exit(str(e))
+    _, matrices = align_annotations(dfs, args.labels, key=key)
+    print(f"{len(matrices[0])} items, {len(names)} annotators: {', '.join(names)}")
+
+    result = agreement(matrices, names, args.labels, n_resamples=args.bootstrap, ci=args.ci, seed=args.seed, workers=args.workers)
+    print(result.to_string(index=False))
+    if args.out:
+        result.to_csv(args.out, index=False)
+
+if __name__ == "__main__":
+    main()
@@ -8,9 +8,9 @@ Calculated metrices:
 - average cohen's kappa 
 """
 import pandas as pd
-from sklearn.metrics import cohen_kappa_score
 import numpy as np
 import sys
+from join_annotations import load_joined, check_concerts, KEY_COLS
 
 '''
 Helper to convert annotations to binary 0/1
@@ -24,52 +24,87 @@ def convert_to_binary(val):
     try:
         num = int(val)
         return 1 if num == 1 else 0
+    except ValueError:
+        pass
+    # whole numbers stored as text, e.g. "1.0"
+    try:
+        return 1 if float(val_str) == 1 else 0
     except ValueError:
         return 0
 
 '''
-Calculate observed agreement, jaccard (set) and adapted cohen's kappa
+Turn the label columns of an annotated table into an n x len(label_cols) uint8 matrix (0/1).
+convert_to_binary is only called once per distinct cell value, the rest is an array lookup.
 '''
-def calculate_multi_label_iaa_binary(file1, file2, label_cols):
-    df1 = pd.read_csv(file1)
-    df2 = pd.read_csv(file2)
-    # apply conversion to binary
-    for col in label_cols:
-        df1[col] = df1[col].apply(convert_to_binary)
-        df2[col] = df2[col].apply(convert_to_binary)
+def to_binary_matrix(df, label_cols):
+    matrix = np.zeros((len(df), len(label_cols)), dtype=np.uint8)
+    for j, col in enumerate(label_cols):
+        # codes index the distinct values (NaN -> -1)
+        codes, uniques = pd.factorize(df[col])
+        lookup = np.array([convert_to_binary(val) for val in uniques] + [0], dtype=np.uint8)
+        matrix[:, j] = lookup[codes]
+    return matrix
+
+'''
+Helper: cohen's kappa from the confusion counts of two binary annotations (n items; n_11: both 1, n_10: only
+annotator 1, n_01: only annotator 2). Works elementwise on arrays of counts.
+Same arithmetic as sklearn's cohen_kappa_score, so the values are identical.
+Labels nobody used (only one class on both sides) give nan, like sklearn.
+'''
+def kappa_from_counts(n_11, n_10, n_01, n):
+    n_00 = n - n_11 - n_10 - n_01
+    # column sums (annotator 2) and row sums (annotator 1)
+    sum0 = (n_00 + n_10, n_01 + n_11)
+    sum1 = (n_00 + n_01, n_10 + n_11)
+    # disagreements observed vs. expected by chance
+    observed = n_01 + n_10
+    expected = sum0[0] * sum1[1] / n + sum0[1] * sum1[0] / n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 1 - observed / expected
+
+'''
+Helper: cohen's kappa of every column of two 0/1 matrices at once.
+'''
+def kappa_per_label(a, b):
+    a = a.astype(bool)
+    b = b.astype(bool)
+    # confusion counts per label (rows: annotator 1, columns: annotator 2)
+    n_11 = np.count_nonzero(a & b, axis=0)
+    n_10 = np.count_nonzero(a & ~b, axis=0)
+    n_01 = np.count_nonzero(~a & b, axis=0)
+    return kappa_from_counts(n_11, n_10, n_01, a.shape[0])
+
+'''
+Calculate observed agreement, jaccard (set) and adapted cohen's kappa of two n x labels 0/1 matrices
+(rows of both matrices have to belong to the same items).
+'''
+def iaa_from_matrices(m1, m2, label_cols):
+    n_items = m1.shape[0]
 
     # get column sums
-    sums_1 = df1[label_cols].sum()
-    sums_2 = df2[label_cols].sum()
+    sums_1 = pd.Series(m1.sum(axis=0, dtype=np.int64), index=label_cols)
+    sums_2 = pd.Series(m2.sum(axis=0, dtype=np.int64), index=label_cols)
 
-    # jaccard 
-    jaccards = []
-    for i in range(len(df1)):
-        a = {label for label in label_cols if df1.loc[i, label] == 1}
-        b = {label for label in label_cols if df2.loc[i, label] == 1}
-        jaccards.append(1.0 if not a and not b else len(a & b) / len(a | b))
+    # jaccard (rows without any label on both sides count as full agreement)
+    intersection = np.count_nonzero(m1 & m2, axis=1)
+    union = np.count_nonzero(m1 | m2, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        jaccards = np.where(union == 0, 1.0, intersection / union)
     avg_jaccard = np.mean(jaccards)
 
-    # percent agreement + kappa
-    label_percent_agreement = {}
-    label_kappa = {}
-    for label in label_cols:
-        y1 = df1[label].astype(int)
-        y2 = df2[label].astype(int)
-        # get percentage
-        label_percent_agreement[label] = (y1 == y2).mean()
-        # get cohens kappa (per label!)
-        label_kappa[label] = cohen_kappa_score(y1, y2)
-    
+    # percent agreement + kappa (per label!)
+    equal = m1 == m2
+    label_percent_agreement = dict(zip(label_cols, equal.mean(axis=0)))
+    label_kappa = dict(zip(label_cols, kappa_per_label(m1, m2)))
+
     avg_kappa = np.mean(list(label_kappa.values()))
 
     # exact row matches (all labels identical for an item)
-    row_equal = (df1[label_cols] == df2[label_cols]).all(axis=1)
-    n_exact_matches = row_equal.sum()
-    prop_exact_matches = n_exact_matches / len(df1)
+    n_exact_matches = equal.all(axis=1).sum()
+    prop_exact_matches = n_exact_matches / n_items
 
     return {
-        "n_items": len(df1),
+        "n_items": n_items,
         "sums_annotator1": sums_1,
         "sums_annotator2": sums_2,
         "avg_jaccard": avg_jaccard,
@@ -80,6 +115,25 @@ def calculate_multi_label_iaa_binary(file1, file2, label_cols):
         "prop_exact_matches": prop_exact_matches  
     }
 
+'''
+Calculate observed agreement, jaccard (set) and adapted cohen's kappa of two joined annotated files.
+Tables with concert keys are matched per concert first; raises ValueError if a concert is only in one of them.
+'''
+def calculate_multi_label_iaa_binary(file1, file2, label_cols):
+    df1 = load_joined(file1)
+    df2 = load_joined(file2)
+    if "concert" in df1.columns and "concert" in df2.columns:
+        # align on (concert, comment_id) instead of the row order (tables of join_annotations.py);
+        # repeated IDs within a concert are matched by the order they appear in
+        from agreement import align_annotations
+        df1, df2 = check_concerts([df1, df2], [file1, file2])
+        _, (m1, m2) = align_annotations([df1, df2], label_cols, key=KEY_COLS)
+    else:
+        # conversion to binary matrices
+        m1 = to_binary_matrix(df1, label_cols)
+        m2 = to_binary_matrix(df2, label_cols)
+    return iaa_from_matrices(m1, m2, label_cols)
+
 
 def main():
     # get joined aannotated csv by annotator 1
@@ -95,7 +149,10 @@ def main():
         "phys_react"
         ]
     # calculate IAA (printed to the terminal)
-    print(calculate_multi_label_iaa_binary(annotator1_joined, annotator2_joined, label_cols))
+    try:
+        print(calculate_multi_label_iaa_binary(annotator1_joined, annotator2_joined, label_cols))
+    except ValueError as e:
+        sys.exit(str(e))
     
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -4,14 +4,19 @@ and preprecesses the csv file for annotation.
 """
 import os
 import sys
+import argparse
 import pandas as pd
 import settings as settings
 from pyyoutube import Api
 import regex as re
-from langdetect import detect
+from language_detection import detect_languages, normalize, LANG_CACHE, UNDETECTABLE
 import emoji
 from pathlib import Path
 
+# shared helpers in the repository root
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from youtube_metadata import MetadataClient
+
 # raw pattern strings
 emoji_unicode_pattern = (
     "[" +
@@ -29,6 +34,27 @@ combined_pattern = f"({emoji_unicode_pattern}|{shortcode_pattern})"
 # compile final regex
 emoji_pattern = re.compile(combined_pattern, flags=re.UNICODE)
 
+'''
+Helper: character class of all single characters in emoji.EMOJI_DATA, merged to ranges (much faster to match).
+'''
+def emoji_char_class():
+    codes = sorted(ord(c) for c in emoji.EMOJI_DATA if len(c) == 1)
+    ranges = []
+    for code in codes:
+        # extend the last range if the code follows directly
+        if ranges and code == ranges[-1][1] + 1:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    parts = [re.escape(chr(a)) if a == b else f"{re.escape(chr(a))}-{re.escape(chr(b))}" for a, b in ranges]
+    return "[" + "".join(parts) + "]"
+
+# every single character that is an emoji (same characters contains_emoji used to look up in emoji.EMOJI_DATA)
+emoji_char_pattern = emoji_char_class()
+emoji_char_regex = re.compile(emoji_char_pattern)
+# any character outside of ascii
+non_ascii_pattern = r"[^\x00-\x7f]"
+
 '''
 Turn csv file into pandas dataframe.
 '''
@@ -39,105 +65,96 @@ def get_comments_csv(file_path):
 '''
 Get name of the publisher/host of the live concert.
 '''
-def get_publisher(api, video_id):
-    # get video object using YouTube Data API
-    video = api.get_video_by_id(video_id=video_id).items[0]
+def get_publisher(metadata, video_id):
+    # get video object using YouTube Data API (cached)
+    video = metadata.get_video(video_id)
     snippet = video.snippet
     # get publisher's name through snippet
     publisher = snippet.channelTitle
     return publisher
 
 '''
-Remove comments of the video's host.
+Read the comments of a live video (without the columns we don't need for this analysis).
 '''
-def remove_publisher_comments(file_path, api, video_id):
+def read_comments(file_path):
     # turn the live-video comment file we want to preprocess into pandas dataframe
     df = get_comments_csv(file_path)
     # remove columns we don't need for this analysis
-    df = df.drop(columns=['comment_date', 'time_delta_since_upload'])
+    return df.drop(columns=['comment_date', 'time_delta_since_upload'])
+
+'''
+Remove the comments of the video's host from a dataframe of its comments.
+'''
+def filter_publisher_comments(df, metadata, video_id):
     # get the publisher of the live-video
-    publisher = get_publisher(api, video_id)
-    
-    # iterate through dataframe
-    for index, row in df.iterrows():
-        # remove row/comment if it is by host of life-video
-        if row['username'].strip() == publisher.strip():
-            df.drop(index, inplace=True)
+    publisher = get_publisher(metadata, video_id)
 
-    return df
+    # keep every row/comment that is not by host of life-video
+    is_publisher = df['username'].str.strip() == publisher.strip()
+    return df[~is_publisher]
+
+'''
+Remove comments of the video's host (read the file and filter it).
+'''
+def remove_publisher_comments(file_path, metadata, video_id):
+    return filter_publisher_comments(read_comments(file_path), metadata, video_id)
 
 '''
 Remove instances from datafram that contain non-ascii characters (broadly non-english instances).
+All checks run on the whole message column at once (boolean masks instead of iterating through the rows).
+Returns the filtered dataframe and the counts of only-emoji, emoji-text and text-only instances.
 '''
-def remove_non_en(df):
-    counter_emoji = 0
-    counter_mixed = 0
-    counter_text = 0
-    # list that stores the indices of the instances that will be removed from dataframe
-    drop_indices = [] # -> nochmal ausgeben!
-    # iterate through dataframe
-    for index, row in df.iterrows():
-        # get the content of the live comment
-        comment = str(row['message']).strip()
-        # leave in comment that only contains emojis
-        if is_emoji_only(comment):
-            counter_emoji = counter_emoji + 1
-            continue
-        # if the comment contains emoji(s)
-        if contains_emoji(comment):
-            counter_mixed = counter_mixed + 1
-            # remove them from the string
-            rest = emoji_pattern.sub(r'', comment)
-            # if the rest of that string contains non-ascii
-            if not rest.isascii():
-                # remove from df
-                drop_indices.append(index)
-            # if it doesn't: leave it in
-            else:
-                continue
-        # if the comment does not contain emojis
-        else:
-            counter_text = counter_text + 1
-            # check if it contains non-ascii
-            if not comment.isascii():
-                # remove instance if so
-                drop_indices.append(index)
-            # leave it in otherwise
-            else:
-                continue
+def filter_non_en(df):
+    # get the content of the live comments
+    comments = df['message'].astype(str).str.strip()
+    # leave in comments that (start with) emojis only
+    emoji_only = comments.str.match(combined_pattern)
+    # comments that contain emoji(s)
+    has_emoji = comments.str.contains(emoji_char_pattern)
+    # the rest of the string without the emojis
+    rest = comments.str.replace(combined_pattern, '', regex=True)
+
+    # emoji-text instances: remove if the rest contains non-ascii, text-only instances: remove if they contain non-ascii
+    non_ascii = (has_emoji & rest.str.contains(non_ascii_pattern)) | (~has_emoji & comments.str.contains(non_ascii_pattern))
+    drop = ~emoji_only & non_ascii
+
+    counter_emoji = int(emoji_only.sum())
+    counter_mixed = int((~emoji_only & has_emoji).sum())
+    counter_text = int((~emoji_only & ~has_emoji).sum())
+
     # remove the "non-english" instances
-    df.drop(index=drop_indices, inplace=True)
-    df.reset_index(drop=True, inplace=True)
-    
-    res_count = f"contains: {counter_emoji} only-emoji instances, {counter_mixed} emoji-text instances and {counter_text} text-only instances."
+    df = df[~drop].reset_index(drop=True)
+    return df, {"only_emoji": counter_emoji, "emoji_text": counter_mixed, "text_only": counter_text}
+
+'''
+Same as filter_non_en, but the counts are returned as printable text.
+'''
+def remove_non_en(df):
+    df, counts = filter_non_en(df)
+    res_count = f"contains: {counts['only_emoji']} only-emoji instances, {counts['emoji_text']} emoji-text instances and {counts['text_only']} text-only instances."
     return df, res_count
 
 '''
 Go over messages once again and remove instances that do not contain ascii-chars but are still probably not english.
+Every distinct message is detected only once (cached, optionally in `workers` processes, see language_detection.py).
 '''
-def remove_langs(df):
-    drop_indices = []
-    for index, row in df.iterrows():
-        # get the content of the live comment
-        comment = str(row['message']).strip()
-        try:
-            if detect(comment) != 'en':
-                drop_indices.append(index)
-        except:
-            continue
+def remove_langs(df, workers=0, cache_path=LANG_CACHE):
+    langs = detect_languages(df['message'], workers=workers, cache_path=cache_path)
+    return keep_english(df, langs)
 
-    df.drop(index=drop_indices, inplace=True)
-    df.reset_index(drop=True, inplace=True)
-    return df     
+'''
+Helper: keep english messages and the ones langdetect can not handle (langs: normalized text -> language).
+'''
+def keep_english(df, langs):
+    detected = df['message'].map(normalize).map(langs)
+    keep = (detected == 'en') | (detected == UNDETECTABLE)
+    return df[keep].reset_index(drop=True)
 
 '''
 Helper: check if message contains emoji at all.
 '''
 def contains_emoji(text):
-    for character in text:
-        if character in emoji.EMOJI_DATA:
-            return True
-    return False
+    return bool(emoji_char_regex.search(text))
 
 '''
 Helper: detect if a string contains only emojis or non-alphanumerics.
@@ -165,32 +182,97 @@ def add_anno_items(df):
 Writes the preprocessed dataframe back into a csv so that it can be annotated.
 Goal directory: "annotation"
 '''
-def to_anno_file(df,api,video_id):
-    video = api.get_video_by_id(video_id=video_id).items[0]
+def to_anno_file(df,metadata,video_id,out_dir='annotation'):
+    # cached, so no second request after get_publisher
+    video = metadata.get_video(video_id)
     snippet = video.snippet
     # get videos name through snippet
     title = snippet.title
-    df.to_csv(Path(f'annotation/{title}.csv'), index=False) 
+    df.to_csv(Path(f'{out_dir}/{title}.csv'), index=False) 
+
+'''
+Preprocess every concert of a round directory (e.g. comments_live/rockpalast) in one run.
+The metadata of all videos is requested at once, and the language detection runs once over the messages of
+all concerts (duplicates across concerts are detected only once, in one pool of `workers` processes).
+Writes one annotation csv per concert to out_dir and returns a summary of the filter counts per concert.
+'''
+def preprocess_round(round_dir, metadata, workers=0, out_dir='annotation'):
+    # all concert folders containing a comments.csv
+    video_ids = sorted(d for d in os.listdir(round_dir) if os.path.isfile(os.path.join(round_dir, d, "comments.csv")))
+    metadata.get_videos(video_ids)
+
+    # publisher and non-ascii filters per concert
+    cleaned = {}
+    summary = []
+    for video_id in video_ids:
+        file_path = Path(round_dir) / video_id / "comments.csv"
+        # every file is read once (the raw count and the publisher filter use the same dataframe)
+        df_raw = read_comments(file_path)
+        n_raw = len(df_raw)
+        df_wo_publisher = filter_publisher_comments(df_raw, metadata, video_id)
+        df_cleaned, counts = filter_non_en(df_wo_publisher)
+        cleaned[video_id] = df_cleaned
+        summary.append({
+            "video_id": video_id,
+            "raw": n_raw,
+            "publisher_removed": n_raw - len(df_wo_publisher),
+            **counts,
+            "non_ascii_removed": len(df_wo_publisher) - len(df_cleaned),
+        })
+
+    # language detection over all concerts at once
+    all_messages = pd.concat([df['message'] for df in cleaned.values()]) if cleaned else pd.Series(dtype=object)
+    langs = detect_languages(all_messages, workers=workers)
+
+    for row in summary:
+        video_id = row["video_id"]
+        df_cleaned_2 = keep_english(cleaned[video_id], langs)
+        row["lang_removed"] = len(cleaned[video_id]) - len(df_cleaned_2)
+        row["kept"] = len(df_cleaned_2)
+        to_anno_file(add_anno_items(df_cleaned_2), metadata, video_id, out_dir)
+
+    return pd.DataFrame(summary)
     
 
 def main():
+    parser = argparse.ArgumentParser(description="Preprocess the live comments of one video (or a whole round) for annotation.")
+    parser.add_argument("rel_dir_path", nargs="?", help="Relative path to the video's folder (e.g. comments_live/xSqL-_RSyJw)")
+    parser.add_argument("--round", help="Preprocess every concert in this directory instead (e.g. comments_live/rockpalast)")
+    parser.add_argument("--summary", help="Output csv for the filter counts of --round. Default: annotation/<round>_summary.csv")
+    parser.add_argument("--workers", type=int, default=0, help="Processes used for language detection. Default: 0 (no pool)")
+    args = parser.parse_args()
+    if not args.rel_dir_path and not args.round:
+        parser.error("either rel_dir_path or --round is required")
+
     # get user api key from settings file
     api = Api(api_key=settings.YOUTUBE_API_KEY)
+    # video metadata is cached in .cache/youtube_metadata
+    metadata = MetadataClient(api)
+
+    if args.round:
+        # all concerts of the round in one run
+        summary = preprocess_round(args.round, metadata, workers=args.workers)
+        summary_path = args.summary or f"annotation/{os.path.basename(os.path.normpath(args.round))}_summary.csv"
+        summary.to_csv(summary_path, index=False)
+        print(summary.to_string(index=False))
+        print(f"Summary saved to {summary_path}")
+        return
+
     # get video URL from command-line argument
-    rel_dir_path = sys.argv[1]
+    rel_dir_path = args.rel_dir_path
     #rel_dir_path = "comments_live/xSqL-_RSyJw"
     video_id = os.path.basename(rel_dir_path)
     file_path = Path(f"comments_live/{video_id}/comments.csv")
     # turn to dataframe
-    df_wo_publisher = remove_publisher_comments(file_path,api,video_id)
+    df_wo_publisher = remove_publisher_comments(file_path,metadata,video_id)
     df_cleaned, res = remove_non_en(df_wo_publisher)
-    df_cleaned_2 = remove_langs(df_cleaned)
+    df_cleaned_2 = remove_langs(df_cleaned, workers=args.workers)
     print(res)
     df_annotation = add_anno_items(df_cleaned_2)
 
     # check if worked 
     #print(df_wo_nonascii.iloc[:20])
-    to_anno_file(df_annotation,api,video_id)
+    to_anno_file(df_annotation,metadata,video_id)
 
 
 if __name__ == "__main__":
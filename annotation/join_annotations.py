@@ -1,48 +1,248 @@
 """
 Reads in all of the annotators annotated files, joins them to 1 (for each annotator).
+Every row gets the key of its concert ("concert", taken from the file name) next to its comment_id, so the joined
+tables of different annotators can be aligned on (concert, comment_id) instead of relying on the row order.
+The files are read and written one after the other, so only one concert is in memory at a time.
+Output as csv or Parquet (by the file extension); in Parquet every concert is one row group, sorted by concert,
+so a single concert can be loaded without reading the rest of the table.
 """
 import os
+import re
 import sys
+import unicodedata
+import argparse
+from pathlib import Path
 import pandas as pd
+# shared chunk writer (repository root)
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chunk_writer import ChunkWriter, string_array, is_parquet
+
+# key columns of a joined table
+KEY_COLS = ["concert", "comment_id"]
 
 '''
-Joins annotated csv files (concerts) -> to be done PER ANNOTATER 
+Concert key of an annotated file: the artist part of the file name (before "_annotated", " - " or ","), lowercase and
+without spaces or punctuation (e.g. "Air_annotated_LK.csv" -> "air", "NilsFrahm_annotated_LK.csv" and
+"Nils Frahm - Live at ..." -> "nilsfrahm", "L'Impératrice, live at ..." -> "limpératrice").
+Annotators name their files differently ("AIR play "Moon Safari" - ..." -> "airplaymoonsafari"), so the keys of
+different tables are matched with match_concerts before comparing them.
 '''
-def join_annotations(in_path, out_path):
-
-    path_dir = in_path
+def concert_key(file_path):
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    # drop the annotation suffix and everything after the artist
+    name = re.split(r"_annotated| - |,", name)[0]
+    name = unicodedata.normalize("NFKC", name).casefold()
+    return "".join(char for char in name if char.isalnum())
 
-    # if `path_dir` is a directory, get the file paths in alphabetical order
+'''
+Helper: file paths of a directory (or a list of paths), ordered by concert key.
+'''
+def list_files(path_dir):
+    # if `path_dir` is a directory, get the csv file paths
     if isinstance(path_dir, str):  # path_dir is a folder path
-        file_list = sorted([os.path.join(path_dir, f) for f in os.listdir(path_dir) if f.endswith('.csv')])
+        file_list = [os.path.join(path_dir, f) for f in os.listdir(path_dir) if f.endswith('.csv')]
     else:  # path_dir is already a list of paths
-        file_list = sorted(path_dir)
+        file_list = list(path_dir)
+    return sorted(file_list, key=lambda path: (concert_key(path), path))
 
-    list_dfs = []
+'''
+Helper: read one annotated file and add its concert key as first column.
+'''
+def read_annotation_file(file_path):
+    df = pd.read_csv(file_path, delimiter=';', encoding='utf-8')
+    df.insert(0, "concert", concert_key(file_path))
+    return df
+
+'''
+Writes the joined table piece by piece (one concert after the other), as csv or as Parquet (see chunk_writer.py).
+Every piece gets the columns of the whole table (a file without one of them gets empty cells); in Parquet all
+columns are (nullable) strings, so concerts without any "x" in a column get the same schema.
+'''
+class JoinedWriter(ChunkWriter):
+    def __init__(self, out_path, columns):
+        self.columns = list(columns)
+        super().__init__(out_path)
 
-    # read in files
+    def to_arrow(self, df):
+        import pyarrow as pa
+        return pa.table({col: string_array(df[col]) for col in self.columns})
+
+    def write(self, df):
+        super().write(df.reindex(columns=self.columns))
+
+'''
+Helper: columns of the joined table (all columns of all files, in the order they first appear).
+Only the headers are read. Files whose header can not be read are left out (they are reported when joining).
+'''
+def joined_columns(file_list):
+    columns = {"concert": None}
     for file_path in file_list:
         try:
-            df_u = pd.read_csv(file_path, delimiter=';', encoding='utf-8')
-            list_dfs.append(df_u)
-        except Exception as e:
-            print(f"Could not read {file_path}: {e}")
-    # join them to one big file
-    df = pd.concat(list_dfs, axis=0, ignore_index=True)
-    # save as joined file
-    df.to_csv(out_path, index=False)
+            header = pd.read_csv(file_path, delimiter=';', encoding='utf-8', nrows=0).columns
+        except Exception:
+            continue
+        columns.update(dict.fromkeys(header))
+    return list(columns)
+
+'''
+Joins annotated csv files (concerts) -> to be done PER ANNOTATER
+Reports files that can not be read, concerts that occur twice, comment IDs that are missing or not unique in a concert
+and files that do not have all columns of the joined table (their missing columns stay empty).
+Returns the number of joined rows.
+'''
+def join_annotations(in_path, out_path):
+    n_rows = 0
+    seen = set()
+    file_list = list_files(in_path)
+    columns = joined_columns(file_list)
+    with JoinedWriter(out_path, columns) as writer:
+        # read in files, one at a time
+        for file_path in file_list:
+            try:
+                df_u = read_annotation_file(file_path)
+            except Exception as e:
+                print(f"Could not read {file_path}: {e}")
+                continue
+            concert = df_u["concert"].iat[0] if len(df_u) else concert_key(file_path)
+            if concert in seen:
+                print(f"{file_path}: concert '{concert}' occurs in more than one file")
+            seen.add(concert)
+            n_missing = df_u["comment_id"].isna().sum()
+            if n_missing:
+                print(f"{file_path}: {n_missing} rows without comment_id")
+            n_duplicates = df_u["comment_id"].dropna().duplicated().sum()
+            if n_duplicates:
+                print(f"{file_path}: {n_duplicates} duplicate comment IDs")
+            missing_cols = [col for col in columns if col not in df_u.columns]
+            if missing_cols:
+                print(f"{file_path}: columns {', '.join(missing_cols)} are missing (left empty)")
+            # append to the joined file
+            writer.write(df_u)
+            n_rows += len(df_u)
+    return n_rows
+
+'''
+Load a joined table (csv or Parquet). For Parquet, concert=... only reads the row group(s) of that concert.
+'''
+def load_joined(path, concert=None, columns=None):
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+        filters = [("concert", "==", concert)] if concert is not None else None
+        return pq.read_table(path, columns=columns, filters=filters).to_pandas()
+    df = pd.read_csv(path, usecols=columns)
+    return df if concert is None else df[df["concert"] == concert]
+
+'''
+Match the concert keys of several tables. Keys that are in every table stay as they are; of the other keys, a key
+that starts with the (shorter) key of another table belongs to the same concert (e.g. "air" and "airplaymoonsafari").
+Returns one dict key -> common key (the shortest) per table.
+Raises ValueError if a key fits more than one concert, or two concerts of the same table would become one
+(rename the files so the artists are told apart).
+'''
+def match_concerts(key_sets):
+    key_sets = [set(keys) for keys in key_sets]
+    shared = set.intersection(*key_sets) if key_sets else set()
+    mappings = [{key: key for key in shared} for _ in key_sets]
+    # common key -> {table index: key of that table} (only keys that are not in every table)
+    groups = {}
+    for key in sorted(set().union(*key_sets) - shared, key=lambda k: (len(k), k)):
+        matches = [common for common in groups if key.startswith(common)]
+        if len(matches) > 1:
+            raise ValueError(f"Concert '{key}' fits several concerts ({', '.join(matches)})")
+        tables = [i for i, keys in enumerate(key_sets) if key in keys]
+        if not matches:
+            groups[key] = dict.fromkeys(tables, key)
+            continue
+        members = groups[matches[0]]
+        clashes = [i for i in tables if i in members]
+        if clashes:
+            raise ValueError(f"Concerts '{members[clashes[0]]}' and '{key}' of the same table can not be told apart")
+        members.update(dict.fromkeys(tables, key))
+    for common, members in groups.items():
+        for table, key in members.items():
+            mappings[table][key] = common
+    return mappings
+
+'''
+Helper: copies of the tables with matched concert keys (see match_concerts).
+'''
+def unify_concerts(dfs):
+    mappings = match_concerts(set(df["concert"].dropna()) for df in dfs)
+    return [df.assign(concert=df["concert"].map(mapping)) for df, mapping in zip(dfs, mappings)]
+
+'''
+Helper: compare the keys of tables with matched concert keys per concert.
+Prints the concerts and comment IDs that are missing in a table.
+Returns the concerts missing in a table (list of (name, concert)) and the number of comment IDs not in every table.
+'''
+def concert_mismatches(dfs, names):
+    concerts = sorted(set().union(*(set(df["concert"].dropna()) for df in dfs)))
+    missing = []
+    n_ids = 0
+    for concert in concerts:
+        ids = {name: set(df.loc[df["concert"] == concert, "comment_id"]) for name, df in zip(names, dfs)}
+        absent = [name for name, concert_ids in ids.items() if not concert_ids]
+        for name in absent:
+            print(f"{name}: concert '{concert}' is missing")
+            missing.append((name, concert))
+        if absent:
+            continue
+        common = set.intersection(*ids.values())
+        for name, concert_ids in ids.items():
+            extra = sorted(concert_ids - common, key=str)
+            if extra:
+                print(f"{name}: {len(extra)} comment IDs of '{concert}' are not in every table (e.g. {', '.join(map(str, extra[:5]))})")
+                n_ids += len(extra)
+    return missing, n_ids
+
+'''
+Match the concerts of joined tables and check them before computing agreement (used by calc_iaa.py and agreement.py).
+Returns the tables with matched concert keys. Raises ValueError if a concert is not in every table
+(comment IDs missing in a table are only reported, those items are skipped).
+'''
+def check_concerts(dfs, names):
+    dfs = unify_concerts(dfs)
+    missing, _ = concert_mismatches(dfs, names)
+    if missing:
+        raise ValueError("Concerts missing in a table: " + ", ".join(f"'{concert}' ({name})" for name, concert in missing))
+    return dfs
+
+'''
+Compare the keys of the joined tables of several annotators (only the key columns are read).
+Prints the concerts and comment IDs that are missing for an annotator and returns the number of mismatches.
+'''
+def compare_joined(paths):
+    try:
+        keys = unify_concerts([load_joined(path, columns=KEY_COLS) for path in paths])
+    except ValueError as e:
+        print(e)
+        return 1
+    missing, n_ids = concert_mismatches(keys, paths)
+    n_mismatches = len(missing) + n_ids
+    if not n_mismatches:
+        print("All tables contain the same concerts and comment IDs")
+    return n_mismatches
 
 def main():
+    parser = argparse.ArgumentParser(description="Join the annotated files of one annotator, or compare joined tables of several annotators.")
     # get directory of the annotated files that should be joined for the given annotator (eg. annotationr2/anno2_lea)
-    annotator_dir = sys.argv[1]
+    parser.add_argument("annotator_dir", nargs="?", help="Directory with the annotator's annotated csv files")
     # get output directory and append the file name automatically
-    out_dir = sys.argv[2]
-    # set name of file 
-    out_filename = sys.argv[3]
-    save = f"{out_dir}/{out_filename}"
-    
+    parser.add_argument("out_dir", nargs="?", help="Directory the joined table is saved to")
+    # set name of file
+    parser.add_argument("out_filename", nargs="?", help="Name of the joined file (.csv or .parquet)")
+    parser.add_argument("--compare", nargs="+", metavar="JOINED", help="Instead: report mismatching keys between joined tables")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare_joined(args.compare) else 0)
+    if not (args.annotator_dir and args.out_dir and args.out_filename):
+        parser.error("annotator_dir, out_dir and out_filename are required")
+    save = f"{args.out_dir}/{args.out_filename}"
+
     # join annotations
-    join_annotations(annotator_dir, save)
+    n_rows = join_annotations(args.annotator_dir, save)
+    print(f"Joined {n_rows} rows into {save}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,89 @@
+"""
+Language detection for the annotation preprocessing (used by create_annotation_file.py).
+Live chats contain the same short messages over and over, so every distinct message is detected only once:
+results are stored in a persistent cache (sqlite, keyed by the message text and the seed), and the messages
+that are not cached yet can be spread over a pool of worker processes.
+langdetect is random by default, so a fixed seed is set in every process to always get the same result.
+"""
+import os
+import sqlite3
+import multiprocessing
+from langdetect import DetectorFactory, detect
+from langdetect.lang_detect_exception import LangDetectException
+
+# default location of the cache (relative to the repository root) and default seed
+LANG_CACHE = ".cache/langdetect.sqlite"
+SEED = 0
+# stored for messages langdetect can not handle (e.g. only emojis or punctuation)
+UNDETECTABLE = ""
+
+'''
+Helper: the text that is detected (and used as cache key) for a message.
+'''
+def normalize(message):
+    return str(message).strip()
+
+'''
+Helper: make langdetect deterministic in the current process.
+'''
+def set_seed(seed):
+    DetectorFactory.seed = seed
+
+'''
+Detect the language of one (normalized) text. Returns UNDETECTABLE if langdetect finds no features.
+'''
+def detect_one(text):
+    try:
+        return detect(text)
+    except LangDetectException:
+        return UNDETECTABLE
+
+'''
+Helper: open the cache (creates the file and table if needed).
+'''
+def open_cache(cache_path):
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    con = sqlite3.connect(cache_path)
+    con.execute("CREATE TABLE IF NOT EXISTS langs (seed INTEGER, text TEXT, lang TEXT, PRIMARY KEY (seed, text))")
+    return con
+
+'''
+Detect the languages of many messages. Every distinct text is only detected once: first the cache is asked,
+the rest is detected (in a pool of `workers` processes if workers > 0) and added to the cache.
+Pass cache_path=None to not use a cache.
+Returns a dict normalized text -> language code (UNDETECTABLE if there is none).
+'''
+def detect_languages(messages, workers=0, cache_path=LANG_CACHE, seed=SEED):
+    # dedupe
+    texts = list(dict.fromkeys(normalize(m) for m in messages))
+    langs = {}
+
+    con = open_cache(cache_path) if cache_path else None
+    if con is not None:
+        # ask the cache in blocks (sqlite limits the number of parameters per query)
+        for start in range(0, len(texts), 500):
+            block = texts[start:start + 500]
+            rows = con.execute(
+                f"SELECT text, lang FROM langs WHERE seed = ? AND text IN ({','.join('?' * len(block))})",
+                [seed] + block,
+            )
+            langs.update(rows)
+
+    missing = [t for t in texts if t not in langs]
+    if missing:
+        if workers > 0:
+            with multiprocessing.Pool(workers, initializer=set_seed, initargs=(seed,)) as pool:
+                chunksize = max(1, len(missing) // (workers * 4))
+                detected = pool.map(detect_one, missing, chunksize=chunksize)
+        else:
+            set_seed(seed)
+            detected = [detect_one(t) for t in missing]
+        langs.update(zip(missing, detected))
+
+        if con is not None:
+            with con:
+                con.executemany("INSERT OR REPLACE INTO langs VALUES (?, ?, ?)", [(seed, t, l) for t, l in zip(missing, detected)])
+
+    if con is not None:
+        con.close()
+    return langs
@@ -0,0 +1,83 @@
+"""
+Shared writer for tables that are written piece by piece (used by heuristics/counts_file.py,
+annotation/join_annotations.py and BERT/predict.py).
+The format is chosen by the file extension of the output path (".parquet" -> Parquet, everything else -> csv).
+The csv header is written only once, the Parquet file gets one row group per written piece.
+The Parquet schema is fixed when the file is opened (given up front, or the one of the first piece), so subclasses
+turn every piece into an arrow table with fixed column types (to_arrow); a column that is empty in the first piece
+would otherwise get the type null and the next piece could not be written.
+"""
+import pandas as pd
+
+# compression used for Parquet files
+PARQUET_COMPRESSION = "zstd"
+
+'''
+Helper: check if a path should be written/read as Parquet.
+'''
+def is_parquet(path):
+    return str(path).endswith(".parquet")
+
+'''
+Helper: cell as text (None for empty cells). Whole numbers read as floats by pandas (e.g. a label column with 1
+and empty cells) are written without ".0", so they stay "1" like in the csv.
+'''
+def cell_to_string(val):
+    if pd.isna(val):
+        return None
+    if isinstance(val, float) and val.is_integer():
+        return str(int(val))
+    return str(val)
+
+'''
+Helper: arrow array of a column as (nullable) strings.
+'''
+def string_array(values):
+    import pyarrow as pa
+    return pa.array(pd.Series(values).map(cell_to_string).tolist(), type=pa.string())
+
+class ChunkWriter:
+    '''
+    schema: arrow schema of the Parquet file (None: the schema of the first piece).
+    '''
+    def __init__(self, out_path, schema=None, compression=PARQUET_COMPRESSION):
+        self.out_path = out_path
+        self.parquet = is_parquet(out_path)
+        self.schema = schema
+        self.compression = compression
+        self.parquet_writer = None
+        self.header_written = False
+
+    '''
+    Arrow table of one piece (subclasses fix the column types here).
+    '''
+    def to_arrow(self, df):
+        import pyarrow as pa
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+    def write(self, df):
+        if self.parquet:
+            import pyarrow.parquet as pq
+            table = self.to_arrow(df)
+            if self.parquet_writer is None:
+                if self.schema is None:
+                    self.schema = table.schema
+                self.parquet_writer = pq.ParquetWriter(self.out_path, self.schema, compression=self.compression)
+            if not table.schema.equals(self.schema):
+                table = table.cast(self.schema)
+            self.parquet_writer.write_table(table)
+        else:
+            # header only once, then append
+            df.to_csv(self.out_path, index=False, mode='a' if self.header_written else 'w', header=not self.header_written)
+            self.header_written = True
+
+    def close(self):
+        if self.parquet_writer is not None:
+            self.parquet_writer.close()
+            self.parquet_writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -1,10 +1,15 @@
 """
 Retrieves the live-chat comments from a YouTube Live video. The script creates a new folder 
 for each video, named after the video's title. 
+With --batch, the live chats of all URLs in a text file are downloaded concurrently.
 """
 import os
 import sys
 import csv
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from chat_downloader import ChatDownloader
 from urllib.parse import urlparse, parse_qs
@@ -13,23 +18,30 @@ from pathlib import Path
 import regex as re
 from typing import Optional
 
+# shared helpers in the repository root
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from youtube_metadata import MetadataClient
+
 YOUTUBE_API_KEY = "enter your API key here"
 base_url = "https://www.googleapis.com/youtube/v3/"
+
 '''
 Returns the Title of the video (for storing).
 '''
-def return_title(api, video_id):
-    # get video object using YouTube Data API
-    video = api.get_video_by_id(video_id=video_id).items[0]
+def return_title(metadata, video_id, video=None):
+    # get video object using YouTube Data API (if not fetched already)
+    if video is None:
+        video = metadata.get_video(video_id)
     snippet = video.snippet
     return snippet.title
 
 '''
 Save basic metadata about a YouTube video as a text file.
 '''
-def save_video_metadata(api, video_id, filename):
-    # get video object using YouTube Data API
-    video = api.get_video_by_id(video_id=video_id).items[0]
+def save_video_metadata(metadata, video_id, filename, video=None):
+    # get video object using YouTube Data API (if not fetched already)
+    if video is None:
+        video = metadata.get_video(video_id)
     # separate descriptive data (snippet) and video's statistics
     snippet = video.snippet
     statistics = video.statistics
@@ -48,37 +60,249 @@ def save_video_metadata(api, video_id, filename):
     # return video's publish date to later calculate time delta for comments
     return published_at
 
+# columns of comments.csv
+chat_fieldnames = ['comment_id', 'username', 'comment_date', 'time_delta_since_upload', 'message']
+
+'''
+Helper: turn one chat message of chat_downloader into a row of comments.csv.
+'''
+def chat_row(message, comment_id):
+    # calculation from timestamp to date is a bit tricky
+    try:
+        comment_date = datetime.fromtimestamp(message.get('timestamp') / 1_000_000)
+    except Exception as e:
+        comment_date = ''
+    return {
+        'comment_id': comment_id,
+        'username': message.get('author', {}).get('name', ''),
+        'comment_date': comment_date,
+        'time_delta_since_upload': message.get('time_text'),
+        'message': message.get('message', '')
+    }
+
+'''
+Helper: path of the checkpoint file of a (partial) comments.csv.
+As long as this file exists, the download of that csv is not finished.
+'''
+def checkpoint_path(output_csv):
+    return output_csv + ".checkpoint"
+
+'''
+Helper: read the checkpoint of a partial download (None if there is none).
+'''
+def load_checkpoint(output_csv):
+    try:
+        with open(checkpoint_path(output_csv), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+'''
+Helper: write the checkpoint (to a temporary file first, so it is never half written).
+'''
+def save_checkpoint(output_csv, state):
+    tmp_path = checkpoint_path(output_csv) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, checkpoint_path(output_csv))
+
 '''
 Writes a csv file of all live-chat comments for a  youtube video (when livestream has already ended).
+A downloader object with a get_chat(url) method can be passed (ChatDownloader by default).
+Every checkpoint_every messages the csv is flushed and a checkpoint (byte offset, comment_id counter, time of the
+last message) is stored next to it. If a checkpoint exists, the download resumes from there and appends to the csv.
 '''
-def save_live_chat(video_url, output_csv, published_at):
-    chat = ChatDownloader().get_chat(video_url)
-    
+def save_live_chat(video_url, output_csv, published_at, downloader=None, checkpoint_every=500):
+    if downloader is None:
+        downloader = ChatDownloader()
+
     id_pre = "ct_" # just a prefix for id
     comment_id = 1 # unique ascending comment ID
-    # write a new csv file
-    with open(output_csv, 'w', newline='', encoding='utf-8') as csvfile:
-        # define the columns of the csv file
-        fieldnames = ['comment_id', 'username', 'comment_date', 'time_delta_since_upload', 'message']
+    # define the columns of the csv file
+    fieldnames = chat_fieldnames
+
+    state = load_checkpoint(output_csv)
+    if state is not None and os.path.exists(output_csv):
+        # drop rows written after the last checkpoint, they are downloaded again
+        with open(output_csv, 'r+b') as f:
+            f.truncate(state['offset'])
+        comment_id = state['comment_id']
+        print(f"Resuming {output_csv} at comment {id_pre}{comment_id} ({state['time_in_seconds']}s into the stream)")
+        # replays can be started at a given second of the stream
+        if state['time_in_seconds'] is not None:
+            chat = downloader.get_chat(video_url, start_time=max(0, state['time_in_seconds']))
+        else:
+            chat = downloader.get_chat(video_url)
+        mode = 'a'
+    else:
+        state = None
+        chat = downloader.get_chat(video_url)
+        mode = 'w'
+
+    # messages at the same timestamp as the last written one (to skip them if they come again)
+    last_timestamp = state['last_timestamp'] if state else None
+    last_ids = set(state['last_ids']) if state else set()
+
+    with open(output_csv, mode, newline='', encoding='utf-8') as csvfile:
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
+
+        # store the current position of the csv in the checkpoint
+        def checkpoint(time_in_seconds):
+            csvfile.flush()
+            save_checkpoint(output_csv, {
+                'offset': csvfile.buffer.tell(),
+                'comment_id': comment_id,
+                'time_in_seconds': time_in_seconds,
+                'last_timestamp': last_timestamp,
+                'last_ids': sorted(last_ids),
+            })
+
+        if mode == 'w':
+            writer.writeheader()
+            # marks the csv as partial right from the start
+            checkpoint(None)
+        time_in_seconds = state['time_in_seconds'] if state else None
+
         # iterate through all live-chat messages
         for message in chat:
-            # calculation from timestamp to date is a bit tricky
-            try:
-                comment_date = datetime.fromtimestamp(message.get('timestamp') / 1_000_000)
-            except Exception as e:
-                comment_date = ''
+            timestamp = message.get('timestamp')
+            # skip messages that were already written before the restart
+            if last_timestamp is not None and timestamp is not None:
+                if timestamp < last_timestamp or (timestamp == last_timestamp and message.get('message_id') in last_ids):
+                    continue
+
             # write information of each chat comment
-            writer.writerow({
-                'comment_id': id_pre + str(comment_id),
-                'username': message.get('author', {}).get('name', ''),
-                'comment_date': comment_date,
-                'time_delta_since_upload': message.get('time_text'),
-                'message': message.get('message', '')
-            })
+            writer.writerow(chat_row(message, id_pre + str(comment_id)))
             comment_id = comment_id + 1
 
+            # remember where we are
+            if timestamp is not None:
+                if timestamp != last_timestamp:
+                    last_timestamp = timestamp
+                    last_ids = set()
+                last_ids.add(message.get('message_id'))
+            if message.get('time_in_seconds') is not None:
+                time_in_seconds = int(message['time_in_seconds'])
+            if (comment_id - 1) % checkpoint_every == 0:
+                checkpoint(time_in_seconds)
+
+    # download complete -> not partial anymore
+    os.remove(checkpoint_path(output_csv))
+
+'''
+Follow the live chat of a stream that is still running.
+Messages are appended to output_csv in small batches (at most batch_size rows, or every flush_seconds),
+so the file is always close to the stream. After every batch one row of rolling heuristics over the last
+window_seconds is appended to features_csv (see heuristics/rolling.py).
+Note: the chat generator blocks until the next message arrives, so an incomplete batch is written with the next message.
+After every batch a checkpoint (same format as in save_live_chat, plus the offset of features_csv) marks the csv as
+partial until the stream has ended. If a checkpoint exists, the run resumes from there: both files are cut back to the
+checkpoint and appended to, the comment IDs continue, and messages the chat sends again are skipped (the rolling window
+starts empty). A finished csv (no checkpoint) is never overwritten.
+'''
+def tail_live_chat(video_url, output_csv, features_csv, downloader=None, batch_size=20, flush_seconds=2.0, window_seconds=60):
+    # only needed in this mode (loads the emoji lexicon of heuristics/)
+    sys.path.append(str(Path(__file__).resolve().parents[1] / "heuristics"))
+    from rolling import RollingWindow, window_cols
+
+    state = load_checkpoint(output_csv)
+    if state is None and os.path.exists(output_csv):
+        raise FileExistsError(f"{output_csv} is already downloaded (no checkpoint), not overwriting it")
+
+    if downloader is None:
+        downloader = ChatDownloader()
+    chat = downloader.get_chat(video_url)
+
+    id_pre = "ct_" # just a prefix for id
+    comment_id = 1 # unique ascending comment ID
+    window = RollingWindow(window_seconds)
+    buffer = []
+    last_flush = time.monotonic()
+
+    resume = state is not None and os.path.exists(output_csv)
+    if resume:
+        # drop rows written after the last checkpoint
+        with open(output_csv, 'r+b') as f:
+            f.truncate(state['offset'])
+        if os.path.exists(features_csv) and state.get('features_offset') is not None:
+            with open(features_csv, 'r+b') as f:
+                f.truncate(state['features_offset'])
+        comment_id = state['comment_id']
+        print(f"Resuming {output_csv} at comment {id_pre}{comment_id}")
+    resume_features = resume and os.path.exists(features_csv) and state.get('features_offset') is not None
+
+    # messages at the same timestamp as the last written one (to skip them if they come again)
+    last_timestamp = state['last_timestamp'] if resume else None
+    last_ids = set(state['last_ids']) if resume else set()
+    time_in_seconds = state['time_in_seconds'] if resume else None
+
+    with open(output_csv, 'a' if resume else 'w', newline='', encoding='utf-8') as csvfile, \
+         open(features_csv, 'a' if resume_features else 'w', newline='', encoding='utf-8') as featfile:
+        writer = csv.DictWriter(csvfile, fieldnames=chat_fieldnames)
+        feat_writer = csv.DictWriter(featfile, fieldnames=window_cols)
+        if not resume:
+            writer.writeheader()
+        if not resume_features:
+            feat_writer.writeheader()
+
+        # store the current position of both files in the checkpoint
+        def checkpoint():
+            csvfile.flush()
+            featfile.flush()
+            save_checkpoint(output_csv, {
+                'offset': csvfile.buffer.tell(),
+                'features_offset': featfile.buffer.tell(),
+                'comment_id': comment_id,
+                'time_in_seconds': time_in_seconds,
+                'last_timestamp': last_timestamp,
+                'last_ids': sorted(last_ids),
+            })
+
+        # marks the csv as partial right from the start
+        checkpoint()
+
+        # write the buffered messages and one summary row of the current window
+        def flush(now):
+            writer.writerows(buffer)
+            buffer.clear()
+            feat_writer.writerow(window.summary(now))
+            checkpoint()
+
+        now = time.time()
+        try:
+            for message in chat:
+                # time of the message in seconds (arrival time if the chat has no timestamp)
+                timestamp = message.get('timestamp')
+                # skip messages that were already written before the restart
+                if last_timestamp is not None and timestamp is not None:
+                    if timestamp < last_timestamp or (timestamp == last_timestamp and message.get('message_id') in last_ids):
+                        continue
+                now = timestamp / 1_000_000 if timestamp is not None else time.time()
+
+                buffer.append(chat_row(message, id_pre + str(comment_id)))
+                comment_id = comment_id + 1
+                window.add(now, message.get('message', ''))
+
+                # remember where we are
+                if timestamp is not None:
+                    if timestamp != last_timestamp:
+                        last_timestamp = timestamp
+                        last_ids = set()
+                    last_ids.add(message.get('message_id'))
+                if message.get('time_in_seconds') is not None:
+                    time_in_seconds = int(message['time_in_seconds'])
+
+                if len(buffer) >= batch_size or time.monotonic() - last_flush >= flush_seconds:
+                    flush(now)
+                    last_flush = time.monotonic()
+        finally:
+            # stream ended or stopped with ctrl+c: write what is left
+            if buffer:
+                flush(now)
+
+    # stream ended (not interrupted) -> not partial anymore
+    os.remove(checkpoint_path(output_csv))
+
 '''
 Extract YouTube video ID from many URL forms:
     - https://www.youtube.com/watch?v=VIDEOID
@@ -143,24 +367,90 @@ def extract_video_id(youtube_url: str, follow_redirects: bool = False) -> Option
 
     return None
 
+'''
+Download metadata and live chat of one video into <out_dir>/<video_id>.
+Returns the path of the created folder.
+'''
+def download_concert(link, metadata, downloader=None, out_dir="comments_live", tail=False):
+    # call func to extract ID from video URL
+    video_id = extract_video_id(link)
+    if video_id is None:
+        raise ValueError(f"Could not extract a video ID from {link}")
+    # get video object once (title + metadata)
+    video = metadata.get_video(video_id)
+    # get title of the video
+    title = return_title(metadata, video_id, video=video)
+    # create new directory (named after video ID)
+    folder_path = os.path.join(out_dir, video_id)
+    output_csv = os.path.join(folder_path, "comments.csv")
+    if os.path.exists(output_csv) and load_checkpoint(output_csv) is None:
+        print(f"Live chat of {video_id} is already downloaded ({output_csv})")
+        return folder_path
+    # the folder already exists if an earlier download was interrupted
+    os.makedirs(Path(folder_path), exist_ok=True)
+    # create metadata text file
+    published_at = save_video_metadata(metadata, video_id, os.path.join(folder_path, f"{title}_info.txt"), video=video)
+    # create csv of comment data
+    if tail:
+        # stream is still running: follow it and write rolling heuristics next to the comments
+        tail_live_chat(link, output_csv, os.path.join(folder_path, "live_features.csv"), downloader=downloader)
+    else:
+        save_live_chat(link, output_csv, published_at, downloader=downloader)
+    return folder_path
+
+'''
+Download many videos concurrently with a bounded pool of worker threads.
+Every video gets its own downloader (created by downloader_factory) and its own folder.
+The metadata of all videos is requested up front in batches (see youtube_metadata.py).
+Returns a dict link -> folder path (or the exception, if that video failed).
+'''
+def download_batch(links, metadata, workers=4, downloader_factory=ChatDownloader, out_dir="comments_live"):
+    # one batched request for all videos, the workers then read from the cache
+    metadata.get_videos([video_id for video_id in map(extract_video_id, links) if video_id])
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(download_concert, link, metadata, downloader_factory(), out_dir): link for link in links}
+        for future in as_completed(futures):
+            link = futures[future]
+            try:
+                results[link] = future.result()
+                print(f"Done: {link} -> {results[link]}")
+            except Exception as e:
+                # one failing video should not stop the others
+                results[link] = e
+                print(f"Failed: {link} ({e})")
+    return results
+
+'''
+Helper: read one URL per line from a text file (empty lines and lines starting with # are skipped).
+'''
+def read_links(file_path):
+    with open(file_path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+
 def main():
-  # get user api key from settings file
-  api = Api(api_key=YOUTUBE_API_KEY)
-  # get video URL from command-line argument
-  link = sys.argv[1]
-  # call func to extract ID from video URL
-  video_id = extract_video_id(link)
-  # get title of the video
-  title = return_title(api, video_id)
-  # create new directory (named after title)
-  path = Path(f"comments_live/{video_id}")
-  os.mkdir(path)
-  folder_path = f"comments_live/{video_id}"
-  # create metadata text file
-  published_at = save_video_metadata(api, video_id, os.path.join(folder_path, f"{title}_info.txt"))
-  os.makedirs(folder_path, exist_ok=True)
-  # create csv of comment data
-  save_live_chat(link, os.path.join(folder_path, "comments.csv"), published_at)
+  parser = argparse.ArgumentParser(description="Download the live chat of YouTube videos.")
+  parser.add_argument("link", nargs="?", help="YouTube link/video URL")
+  parser.add_argument("--batch", help="Text file with one YouTube link per line")
+  parser.add_argument("--workers", type=int, default=4, help="Number of videos downloaded at the same time (--batch). Default: 4")
+  parser.add_argument("--tail", action="store_true", help="Follow a stream that is still live and write rolling heuristics to live_features.csv")
+  parser.add_argument("--out-dir", default="comments_live", help="Directory the video folders are created in. Default: comments_live")
+  args = parser.parse_args()
+  if not args.link and not args.batch:
+    parser.error("either a link or --batch is required")
+
+  # get user api key from settings file (metadata is cached in .cache/youtube_metadata)
+  metadata = MetadataClient(Api(api_key=YOUTUBE_API_KEY))
+  if args.batch:
+    # download all videos of the file concurrently
+    results = download_batch(read_links(args.batch), metadata, workers=args.workers, out_dir=args.out_dir)
+    n_failed = sum(isinstance(r, Exception) for r in results.values())
+    print(f"Downloaded {len(results) - n_failed} of {len(results)} live chats.")
+    if n_failed:
+      sys.exit(1)
+  else:
+    # get video URL from command-line argument
+    download_concert(args.link, metadata, out_dir=args.out_dir, tail=args.tail)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
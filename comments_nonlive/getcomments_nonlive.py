@@ -5,12 +5,21 @@ named after the video's title.
 
 import os
 import sys
+import csv
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-import pandas as pd
-from pyyoutube import Api
+from pyyoutube import Api, PyYouTubeException
 from urllib.parse import urlparse, parse_qs
 import regex as re
 from typing import Optional
+from pathlib import Path
+
+# shared helpers in the repository root
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from youtube_metadata import MetadataClient
 
 YOUTUBE_API_KEY ="enter your API key here"
 base_url = "https://www.googleapis.com/youtube/v3/"
@@ -18,9 +27,9 @@ base_url = "https://www.googleapis.com/youtube/v3/"
 '''
 Returns the Title of the video (for storing).
 '''
-def return_title(api, video_id):
-    # get video object using YouTube Data API
-    video = api.get_video_by_id(video_id=video_id).items[0]
+def return_title(metadata, video_id):
+    # get video object using YouTube Data API (cached)
+    video = metadata.get_video(video_id)
     snippet = video.snippet
     return snippet.title
 
@@ -28,9 +37,9 @@ def return_title(api, video_id):
 '''
 Save basic metadata about a YouTube video as a text file.
 '''
-def save_video_metadata(api, video_id, filename):
-    # get video object using YouTube Data API
-    video = api.get_video_by_id(video_id=video_id).items[0]
+def save_video_metadata(metadata, video_id, filename):
+    # get video object using YouTube Data API (cached, so no second request after return_title)
+    video = metadata.get_video(video_id)
     # separate descriptive data (snippet) and video's statistics
     snippet = video.snippet
     statistics = video.statistics
@@ -50,47 +59,123 @@ def save_video_metadata(api, video_id, filename):
     # return video's publish date to later calculate time delta for comments
     return published_at
 
+# the YouTube Data API returns at most 100 comment threads per page
+COMMENTS_PER_PAGE = 100
+# HTTP status codes that are retried with backoff (rate limits and server errors)
+RETRY_STATUS = {429, 500, 503}
+# reasons of a 403 that are retried: short-term rate limits. "quotaExceeded" (daily quota used up) is not retried,
+# it only resets the next day
+RETRY_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+'''
+Helper: reasons of a YouTube API error (e.g. "quotaExceeded", "commentsDisabled"), empty for errors without a response.
+'''
+def error_reasons(error):
+    try:
+        errors = error.response.json()["error"]["errors"]
+    except (AttributeError, ValueError, KeyError, TypeError):
+        return set()
+    return {e.get("reason") for e in errors}
+
+'''
+Helper: check if an API error is worth retrying (403 only for rate limits, not for the daily quota or disabled comments).
+'''
+def is_retryable(error):
+    if error.status_code in RETRY_STATUS:
+        return True
+    return error.status_code == 403 and bool(error_reasons(error) & RETRY_REASONS)
+
+'''
+Helper: send exactly one GET request to the YouTube Data API and return the parsed response
+(raises PyYouTubeException for API errors).
+This is the only place that uses the private request helpers of pyyoutube.Api (python-youtube==0.9.8, pinned in
+setup/requirements.txt): the public get_comment_threads calls paged_by_page_token, which keeps requesting pages until
+`count` items are collected and then cuts the list, so items of a short page are dropped and the returned page token
+does not fit the items. Check this helper when updating python-youtube.
+'''
+def api_get(api, resource, args):
+    resp = api._request(resource=resource, method="GET", args=args)
+    return api._parse_response(resp)
+
+'''
+Request one page of top-level comment threads. Retries with exponential backoff (plus jitter)
+when YouTube answers with a rate-limit or server error.
+'''
+def request_comment_page(api, video_id, page_token=None, max_retries=6, base_delay=1.0):
+    args = {
+        "part": "snippet",
+        "videoId": video_id,
+        "maxResults": COMMENTS_PER_PAGE,
+        "textFormat": "html",
+    }
+    if page_token is not None:
+        args["pageToken"] = page_token
+
+    for attempt in range(max_retries + 1):
+        try:
+            return api_get(api, "commentThreads", args)
+        except PyYouTubeException as e:
+            if not is_retryable(e) or attempt == max_retries:
+                raise
+            # wait longer after every failed attempt
+            delay = base_delay * (2 ** attempt) + random.uniform(0, base_delay)
+            print(f"{video_id}: YouTube answered {e.status_code}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+'''
+Yield the comment threads of a video page by page (one request per page, nothing is kept in memory).
+'''
+def fetch_comment_pages(api, video_id):
+    page_token = None
+    while True:
+        data = request_comment_page(api, video_id, page_token)
+        yield data.get("items", [])
+        # if there is no page token, there is no more data
+        page_token = data.get("nextPageToken")
+        if page_token is None:
+            break
+
 '''
-Save all top-level comments (not including replies) to csv file
+Save all top-level comments (not including replies) to csv file.
+Rows are written as soon as their page arrives, so memory use does not depend on the number of comments.
 '''
 def save_comments_to_csv(api, video_id, published_at, filename):
-    # fetch all top-level comment threads 
-    comment_threads = api.get_comment_threads(video_id=video_id, count=None)
-    rows = []
-    
     id_pre = "ct_" # just a prefix for id
     comment_id = 1 # unique ascending comment ID
 
-    # iterate through all comments
-    for ct in comment_threads.items:
-        # only retreive the top-level comment
-        top_comment = ct.snippet.topLevelComment.snippet
-        # get username of commentor and published time
-        username = top_comment.authorDisplayName
-        comment_date = datetime.fromisoformat(top_comment.publishedAt.replace("Z", "+00:00"))
-        # compute time difference from when the video was published
-        time_delta = comment_date - published_at
-        # get the actual comment content
-        content = top_comment.textOriginal
-        # remove line-breaks from comment (better readability in csv format)
-        content_one_row = re.sub(r'\s*\n\s*', '', content)
-
-        # to the row-list append all extracted info
-        rows.append({
-            "comment_id": id_pre + str(comment_id),
-            "username": username,
-            "comment_date": comment_date.isoformat(),
-            "time_delta_since_upload": str(time_delta),
-            "comment_text": content_one_row,
-        })
-        # increment unique id for next comment
-        comment_id += 1
-
-    # create pandas dataframe
-    df = pd.DataFrame(rows)
-    # write to csv
-    df.to_csv(filename, index=False, encoding='utf-8')
+    with open(filename, "w", newline="", encoding="utf-8") as csvfile:
+        # same columns and line endings as the former pandas output
+        fieldnames = ["comment_id", "username", "comment_date", "time_delta_since_upload", "comment_text"]
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, lineterminator="\n")
+        writer.writeheader()
+
+        # iterate through all comments, page by page
+        for items in fetch_comment_pages(api, video_id):
+            for ct in items:
+                # only retreive the top-level comment
+                top_comment = ct["snippet"]["topLevelComment"]["snippet"]
+                # get username of commentor and published time
+                username = top_comment.get("authorDisplayName")
+                comment_date = datetime.fromisoformat(top_comment["publishedAt"].replace("Z", "+00:00"))
+                # compute time difference from when the video was published
+                time_delta = comment_date - published_at
+                # get the actual comment content
+                content = top_comment.get("textOriginal") or ""
+                # remove line-breaks from comment (better readability in csv format)
+                content_one_row = re.sub(r'\s*\n\s*', '', content)
 
+                writer.writerow({
+                    "comment_id": id_pre + str(comment_id),
+                    "username": username,
+                    "comment_date": comment_date.isoformat(),
+                    "time_delta_since_upload": str(time_delta),
+                    "comment_text": content_one_row,
+                })
+                # increment unique id for next comment
+                comment_id += 1
+            # make the rows of this page visible in the file right away
+            csvfile.flush()
+    return comment_id - 1
 
 '''
 Extract YouTube video ID from many URL forms:
@@ -157,22 +242,70 @@ def extract_video_id(youtube_url: str, follow_redirects: bool = False) -> Option
     return None
   
 
-def main():
-  # get user api key from settings file
-  api = Api(api_key=YOUTUBE_API_KEY)
-  # get video URL from command-line argument
-  link = sys.argv[1]
+'''
+Download metadata and comments of one video into comments_nonlive/<title>.
+Returns the path of the created folder.
+'''
+def download_video(link, api, metadata):
   # call func to extract ID from video URL
   video_id = extract_video_id(link)
-  title = return_title(api,video_id)
+  title = return_title(metadata,video_id)
   os.mkdir(f"comments_nonlive/{title}")
   # create new directory (named after video title
   folder_path = f"comments_nonlive/{title}"
   os.makedirs(folder_path, exist_ok=True)
   # create metadata text file
-  published_at = save_video_metadata(api, video_id, os.path.join(folder_path, "info.txt"))
+  published_at = save_video_metadata(metadata, video_id, os.path.join(folder_path, "info.txt"))
   # create csv of comment data
-  save_comments_to_csv(api, video_id, published_at, os.path.join(folder_path, "comments.csv"))
+  n_comments = save_comments_to_csv(api, video_id, published_at, os.path.join(folder_path, "comments.csv"))
+  print(f"Saved {n_comments} comments of {link} to {folder_path}")
+  return folder_path
+
+'''
+Download several videos at the same time (bounded number of worker threads).
+Returns a dict link -> folder path (or the exception, if that video failed).
+'''
+def download_batch(links, api, metadata, workers=4):
+  # one batched metadata request for all videos
+  metadata.get_videos([video_id for video_id in map(extract_video_id, links) if video_id])
+  results = {}
+  with ThreadPoolExecutor(max_workers=workers) as pool:
+    futures = {pool.submit(download_video, link, api, metadata): link for link in links}
+    for future in as_completed(futures):
+      link = futures[future]
+      try:
+        results[link] = future.result()
+      except Exception as e:
+        # one failing video should not stop the others
+        results[link] = e
+        print(f"Failed: {link} ({e})")
+  return results
+
+def main():
+  parser = argparse.ArgumentParser(description="Download the top-level comments of YouTube videos.")
+  parser.add_argument("link", nargs="?", help="YouTube link/video URL")
+  parser.add_argument("--batch", help="Text file with one YouTube link per line")
+  parser.add_argument("--workers", type=int, default=4, help="Number of videos downloaded at the same time (--batch). Default: 4")
+  args = parser.parse_args()
+  if not args.link and not args.batch:
+    parser.error("either a link or --batch is required")
+
+  # get user api key from settings file
+  api = Api(api_key=YOUTUBE_API_KEY)
+  # video metadata is cached in .cache/youtube_metadata
+  metadata = MetadataClient(api)
+  if args.batch:
+    # one URL per line (empty lines and lines starting with # are skipped)
+    with open(args.batch, encoding="utf-8") as f:
+      links = [line.strip() for line in f if line.strip() and not line.strip().startswith("#")]
+    results = download_batch(links, api, metadata, workers=args.workers)
+    n_failed = sum(isinstance(r, Exception) for r in results.values())
+    print(f"Downloaded {len(results) - n_failed} of {len(results)} videos.")
+    if n_failed:
+      sys.exit(1)
+  else:
+    # get video URL from command-line argument
+    download_video(args.link, api, metadata)
 
 if __name__ == "__main__":
     main()
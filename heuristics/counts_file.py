@@ -0,0 +1,76 @@
+"""
+Writes and reads the heuristics table (counts) as csv or Parquet.
+The format is chosen by the file extension of the output path (".parquet" -> Parquet, everything else -> csv).
+In Parquet the list columns ("emoji_categories" and the five "*_mean" ratings) are stored as real
+list<string>/list<double> columns, and the concert prefix of "concert_w_ID" is stored in a dictionary-encoded
+"concert" column, so the table can be loaded without parsing any text.
+"""
+import ast
+import sys
+from pathlib import Path
+import pandas as pd
+from lexicon import RATING_COLS
+# shared chunk writer (repository root)
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from chunk_writer import ChunkWriter, is_parquet
+
+# count columns and list columns of the heuristics table
+int_cols = ["plu_pro", "sin_pro", "word_count", "char_count", "allcaps_c", "emoji_count"]
+list_cols = ["emoji_categories"] + RATING_COLS
+
+'''
+Helper: arrow type of a known column (None -> let pyarrow infer it).
+'''
+def column_type(col):
+    import pyarrow as pa
+    if col in int_cols:
+        return pa.int64()
+    if col == "emoji_categories":
+        return pa.list_(pa.string())
+    if col in RATING_COLS:
+        return pa.list_(pa.float64())
+    if col in ("concert_w_ID", "message"):
+        return pa.string()
+    return None
+
+'''
+Turn a heuristics data frame into an arrow table with native list columns and a dictionary-encoded "concert" column.
+'''
+def to_arrow(df):
+    import pyarrow as pa
+    names = []
+    arrays = []
+    for col in df.columns:
+        names.append(col)
+        arrays.append(pa.array(df[col], type=column_type(col), from_pandas=True))
+        if col == "concert_w_ID":
+            # "<video_id>_ct_<n>" -> "<video_id>" (only a few distinct values -> dictionary)
+            concert = df[col].astype(str).str.replace(r"_ct_\d+$", "", regex=True)
+            names.append("concert")
+            arrays.append(pa.array(concert, type=pa.string()).dictionary_encode())
+    return pa.Table.from_arrays(arrays, names=names)
+
+'''
+Writes the heuristics table to out_path, either at once or piece by piece (one concert/chunk after the other).
+The csv header is written only once, the Parquet file gets one row group per written piece (see chunk_writer.py).
+'''
+class CountsWriter(ChunkWriter):
+    def to_arrow(self, df):
+        return to_arrow(df)
+
+'''
+Load a heuristics table written by heuristics.py.
+Parquet: list columns are loaded directly (as_arrow=True returns the arrow table without converting to pandas).
+csv: the stringified lists (e.g. "[82.1, 57.0]") are parsed back into python lists.
+'''
+def load_counts(path, as_arrow=False):
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+        return table if as_arrow else table.to_pandas()
+
+    df = pd.read_csv(path)
+    for col in list_cols:
+        if col in df.columns:
+            df[col] = df[col].apply(ast.literal_eval)
+    return df
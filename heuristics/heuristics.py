@@ -4,283 +4,377 @@ The following collumns/data are/is added:
 - "clarity_mean", "arousal_mean", "valence_mean", "familarity_mean", "complexity_mean" (from "https://tscheffler.github.io/2024-Face-Emoji-Norming/ratings.html")
 - "plu_pro" (plural pronouns), "sin_pro" (singular pronouns), "word_count","char_count","allcaps_c","emoji_count", "emoji_categories"
 """
-import pandas as pd 
-import emoji
 import pandas as pd
+import emoji
 import re
 import os
-import sys
+import argparse
+import hashlib
+import multiprocessing
+from functools import partial
+from lexicon import get_lexicon, lexicon_version, EMPTY_ENTRY, RATING_COLS
+from counts_file import CountsWriter
 
 # define columns to drop
 cols_to_drop = ["username", "comment_date", "time_delta_since_upload"]
 col_to_add = ["concert_w_ID"]
 
 '''
-Joins all comments.csv files from subfolders of in_path. Builds concert_w_ID = <subfolder_name>_<comment_id> and puts it at column 0.
-Drops comment_id and other unwanted columns.
+Find all comments.csv files in the subfolders of in_path (in the order of os.walk).
 '''
-def join_comments_live(in_path):
-    
-    list_dfs = []
+def find_concerts(in_path):
+    csv_paths = []
     # walk through all folders and files under in_path
     for root, dirs, files in os.walk(in_path):
+        # check if this folder contains a file named 'comments.csv'
         if "comments.csv" in files:
-            
-            # check if this folder contains a file named 'comments.csv'
-            csv_path = os.path.join(root, "comments.csv")
-            # the folder name (immediately above the file) will be the concert name
-            subdir = os.path.basename(root)  
-            # read in csv
-            df_u = pd.read_csv(csv_path, delimiter=',', encoding='utf-8')
-            
-            # check that 'comment_id' column exists before using it
-            if "comment_id" not in df_u.columns:
-                raise KeyError(f"'comment_id' column missing in {csv_path}")
-            
-            # build new 'concert_w_ID' column by combining folder name and comment_id
-            concert_ids = subdir + "_" + df_u["comment_id"].astype(str)
-            # drop the original 'comment_id' column, as requested
-            df_u = df_u.drop(columns=["comment_id"])
-            # insert 'concert_w_ID' at the first column position (index 0)
-            df_u.insert(0, "concert_w_ID", concert_ids)
-            # drop other unwanted columns 
-            df_u = df_u.drop(columns=[c for c in cols_to_drop if c in df_u.columns], errors='ignore')
-            # append this processed DataFrame to list
-            list_dfs.append(df_u)
+            csv_paths.append(os.path.join(root, "comments.csv"))
+    return csv_paths
+
+'''
+Builds concert_w_ID = <subfolder_name>_<comment_id> and puts it at column 0.
+Drops comment_id and other unwanted columns.
+'''
+def prepare_concert(df_u, csv_path):
+    # the folder name (immediately above the file) will be the concert name
+    subdir = os.path.basename(os.path.dirname(csv_path))
+
+    # check that 'comment_id' column exists before using it
+    if "comment_id" not in df_u.columns:
+        raise KeyError(f"'comment_id' column missing in {csv_path}")
 
+    # build new 'concert_w_ID' column by combining folder name and comment_id
+    concert_ids = subdir + "_" + df_u["comment_id"].astype(str)
+    # drop the original 'comment_id' column, as requested
+    df_u = df_u.drop(columns=["comment_id"])
+    # insert 'concert_w_ID' at the first column position (index 0)
+    df_u.insert(0, "concert_w_ID", concert_ids)
+    # drop other unwanted columns
+    df_u = df_u.drop(columns=[c for c in cols_to_drop if c in df_u.columns], errors='ignore')
+    return df_u
+
+'''
+Reads one comments.csv file (see prepare_concert).
+'''
+def read_concert(csv_path):
+    # read in csv (messages always as text, even if a message looks like a number)
+    df_u = pd.read_csv(csv_path, delimiter=',', encoding='utf-8', dtype={"message": str})
+    return prepare_concert(df_u, csv_path)
+
+'''
+Reads one comments.csv file in chunks of chunksize rows (see prepare_concert).
+'''
+def read_concert_chunks(csv_path, chunksize):
+    with pd.read_csv(csv_path, delimiter=',', encoding='utf-8', dtype={"message": str}, chunksize=chunksize) as reader:
+        for df_u in reader:
+            yield prepare_concert(df_u, csv_path)
+
+'''
+Joins all comments.csv files from subfolders of in_path (see read_concert).
+'''
+def join_comments_live(in_path):
+    list_dfs = [read_concert(csv_path) for csv_path in find_concerts(in_path)]
     return pd.concat(list_dfs, axis=0, ignore_index=True)
 
-# get expected directory from command line argument
-total_df = join_comments_live(sys.argv[1])
 # colmns from study "https://tscheffler.github.io/2024-Face-Emoji-Norming/ratings.html"
-ratings_list = ["clarity_mean", "arousal_mean", "valence_mean", "familarity_mean", "complexity_mean"]
+ratings_list = RATING_COLS
 # other columns for heuristic data to be counted
 basic_heuristics = ["plu_pro", "sin_pro", "word_count","char_count","allcaps_c","emoji_count", "emoji_categories"]
 # all categories we need
-total_list = basic_heuristics + ratings_list  
+total_list = basic_heuristics + ratings_list
+
+# dictionaries containing pronouns to check
+sin_pronouns = {'i', 'id', 'i\'d', 'i\'ll', 'im', 'i\'m', 'ive', 'i\'ve', 'me', 'mine', 'my', 'myself'}
+plu_pronouns = {'lets', 'let\'s', 'our', 'ours', 'ourselves', 'us', 'we', 'we\'d', 'we\'ll', 'we\'re', 'weve', 'we\'ve'}
 
-# initialize with 0's
-for col in total_list:
-    total_df[col] = 0  # or 0, np.nan, '', etc. 
+# precompiled patterns (all-caps words with > 1 character, de-rendered emojis)
+allcaps_pattern = re.compile(r'\b[A-Z]{2,}\b')
+shortcode_pattern = re.compile(r':[a-z_]+:')
+
+# characters stripped from words before checking for pronouns
+strip_chars = ".,!?\"'()[]"
 
 '''
-Count all-caps words with > 1 character.
+Look up the emojis of a message in the lexicon.
+Returns the sorted categories and one list per rating (order of ratings_list).
 '''
-def count_allcaps_words(text):
-    return len(re.findall(r'\b[A-Z]{2,}\b', text))
+def lookup_emojis(em_list):
+    # emoji categories and ratings (shortcode -> (categories, ratings)), loaded on first use
+    lexicon = get_lexicon()
+    categories = []
+    ratings = [[] for _ in ratings_list]
+    for i in em_list:
+        em_categories, em_ratings = lexicon.get(i, EMPTY_ENTRY)
+        categories.extend(em_categories)
+        # one value per rating for every row of crawled_data the emoji is found in
+        for values in em_ratings:
+            for pos, value in enumerate(values):
+                ratings[pos].append(value)
+    return [sorted(categories)] + ratings
 
-# apply to each row in the "message" column
-total_df['allcaps_c'] = total_df['message'].apply(count_allcaps_words)
-# de-render emojis
-total_df["message"] = total_df["message"].apply(lambda x: emoji.demojize(x.lower()))
+'''
+Compute all heuristic columns of one message in a single pass.
+Returns the de-rendered (lower-case) message and the values in the order of total_list.
+'''
+def extract_features(message):
+    # count all-caps words before the message is lower-cased
+    allcaps_c = len(allcaps_pattern.findall(message))
+    # de-render emojis
+    text = emoji.demojize(message.lower())
 
-# dictionaries containing pronouns to check
-sin_pronouns = {'i', 'id', 'i\'d', 'i\'ll', 'im', 'i\'m', 'ive', 'i\'ve', 'me', 'mine', 'my', 'myself'}
-plu_pronouns = {'lets', 'let\'s', 'our', 'ours', 'ourselves', 'us', 'we', 'we\'d', 'we\'ll', 'we\'re', 'weve', 'we\'ve'}
+    # tokenize once for words and pronouns
+    words = text.lower().split()
+    sin_pro = 0
+    plu_pro = 0
+    for word in words:
+        word = word.strip(strip_chars)
+        if word in sin_pronouns:
+            sin_pro += 1
+        if word in plu_pronouns:
+            plu_pro += 1
+
+    # find emojis once and look each of them up in the lexicon
+    em_list = shortcode_pattern.findall(text)
+
+    return text, [plu_pro, sin_pro, len(words), len(text), allcaps_c, len(em_list)] + lookup_emojis(em_list)
 
 '''
-Count singular pronouns.
+Scalar engine: compute the heuristic columns row by row with extract_features.
 '''
-def count_sin_pronouns(text):
-    words = text.lower().split()
-    return sum(word.strip(".,!?\"'()[]") in sin_pronouns for word in words)
-# apply to the "message" column
-total_df['sin_pro'] = total_df['message'].apply(count_sin_pronouns)
+def scalar_features(messages):
+    texts = []
+    rows = []
+    for message in messages:
+        text, values = extract_features(message)
+        texts.append(text)
+        rows.append(values)
+    return pd.Series(texts, index=messages.index, dtype=object), pd.DataFrame(rows, columns=total_list, index=messages.index)
 
 '''
-Count plural pronouns.
+Vectorized engine: compute the counters with pandas string methods on whole columns.
+Words are exploded to one row per word, checked against the pronoun sets and summed back per message.
+Only de-rendering the emojis and the lexicon lookup stay row-wise.
 '''
-def count_plu_pronouns(text):
-    words = text.lower().split()
-    return sum(word.strip(".,!?\"'()[]") in plu_pronouns for word in words)
-# apply to the "message" column
-total_df['plu_pro'] = total_df['message'].apply(count_plu_pronouns)
+def vectorized_features(messages):
+    # work on a positional index, so exploded words can be grouped back to their message
+    original = messages.reset_index(drop=True)
+    features = pd.DataFrame(index=original.index)
+
+    # count all-caps words before the message is lower-cased
+    allcaps_c = original.str.count(allcaps_pattern.pattern)
+    # de-render emojis
+    texts = original.str.lower().map(emoji.demojize)
+
+    # one row per word (messages without words become one NaN row)
+    words = texts.str.lower().str.split()
+    exploded = words.explode().str.strip(strip_chars)
+    features['plu_pro'] = exploded.isin(plu_pronouns).groupby(level=0).sum()
+    features['sin_pro'] = exploded.isin(sin_pronouns).groupby(level=0).sum()
+    features['word_count'] = words.str.len()
+    features['char_count'] = texts.str.len()
+    features['allcaps_c'] = allcaps_c
+    features['emoji_count'] = texts.str.count(shortcode_pattern.pattern)
+
+    # emoji categories and ratings (lists) come from the lexicon
+    lists = pd.DataFrame(texts.str.findall(shortcode_pattern.pattern).map(lookup_emojis).tolist(),
+                         columns=["emoji_categories"] + ratings_list, index=original.index)
+    features = pd.concat([features, lists], axis=1).astype({col: "int64" for col in basic_heuristics[:-1]})
+
+    features.index = messages.index
+    texts.index = messages.index
+    return texts.astype(object), features
+
+# available engines (selected with --engine)
+engines = {"scalar": scalar_features, "vectorized": vectorized_features}
 
 '''
-Count word amount.
+Add all heuristic columns (total_list) to a data frame with a "message" column.
+The "message" column is replaced by its de-rendered, lower-case version.
 '''
-def count_words(text):
-    words = text.lower().split()
-    return len(words)
-# apply to the "message" column
-total_df['word_count'] = total_df['message'].apply(count_words)
-
-'''
-Count character amount.
-'''
-def count_chars(text):
-    chars = 0
-    for i in text:
-        chars = chars + 1
-    return chars
-# apply to the "message" column
-total_df['char_count'] = total_df['message'].apply(count_chars)
-
-'''
-Count emojis.
-'''
-def count_emojis(text):
-    em_list = re.findall(r':[a-z_]+:',text)
-    return len(em_list)
-# apply to the "message" column
-total_df['emoji_count'] = total_df['message'].apply(count_emojis)
-
-'''
-Helper: make emojis.csv processable.
-'''
-def read_ragged_csv(filepath):
-    # open the file
-    with open(filepath, 'r', encoding='utf-8') as f:
-        lines = [line.strip().split(',') for line in f if line.strip()]
-    
-    # get max number of columns
-    max_len = max(len(line) for line in lines)
-    
-    # pad each line with empty strings if necessary
-    padded_lines = [line + [''] * (max_len - len(line)) for line in lines]
-    
-    # convert to data frame
-    df = pd.DataFrame(padded_lines)
+def add_heuristics(df, engine="scalar"):
+    texts, features = engines[engine](df['message'])
+
+    df = df.copy()
+    df['message'] = texts
+    for col in total_list:
+        df[col] = features[col]
     return df
-# get emoji data frame for further data analysis
-df_emoji = read_ragged_csv("heuristics/emojis/emojis.csv")
 
 '''
-Get emoji categories of given emojis (as list).
+Compute the heuristics with both engines and make sure the vectorized engine matches the scalar path.
 '''
-def emoji_category(text):
-    df = read_ragged_csv("heuristics/emojis/emojis.csv")
-    matching_indices = []
-    # help to get emojis in message with regex
-    em_list = re.findall(r':[a-z_]+:',text)
-    # iterate through the emoji list
-    for i in em_list:
-        # try to match categories from emojis.csv file
-        mask = df.astype(str).apply(lambda row: row.str.contains(i, case=False, na=False)).any(axis=1)
-        matches = df.index[mask].tolist()
-        matching_indices.extend(matches) 
-    # append categories to list
-    first_elements = [df.iloc[i, 0] for i in matching_indices]
-    return sorted(first_elements)
-# apply to "message"
-total_df['emoji_categories'] = total_df['message'].apply(emoji_category)
-
-# remove some of the crawled categories
-drops_crawled = ["emoji","twitter_freq","whatsapp_freq","num_ratings"]
-
-'''
-Get values of clarity for all emojis found in message (as list).
-'''
-def clarity_means(text):
-    # get crawled_data.csv 
-    crawled_data = pd.read_csv('heuristics/emojis/crawled_data.csv', sep=',').drop(columns=drops_crawled, errors='ignore')
-    # list to store results in
-    clarity_means_l = []
-    # find emojis and store them in list
-    em_list = re.findall(r':[a-z_]+:',text)
-    # iterate through emoji list
-    for i in em_list:
-        for idx, emoji in enumerate(crawled_data['unicode_name']):
-            # append clarity value to clarity list if emoji is found in crawled_data dataframe
-            if i == str(emoji):
-                clarity_means_l.append(crawled_data['clarity_mean'].iloc[idx])
-    return clarity_means_l
-# apply to message
-total_df['clarity_mean'] = total_df['message'].apply(clarity_means)
-
-'''
-Get values of arousal for all emojis found in message (as list).
-'''
-def arousal_means(text):
-    # get crawled_data.csv 
-    crawled_data = pd.read_csv('heuristics/emojis/crawled_data.csv', sep=',').drop(columns=drops_crawled, errors='ignore')
-    # list to store results in
-    arousal_means_l = []
-    # find emojis and store them in list
-    em_list = re.findall(r':[a-z_]+:',text)
-    # iterate through emoji list
-    for i in em_list:
-        for idx, emoji in enumerate(crawled_data['unicode_name']):
-            # append arousal value to arousal list if emoji is found in crawled_data dataframe
-            if i == str(emoji):
-                arousal_means_l.append(crawled_data['arousal_mean'].iloc[idx])
-    return arousal_means_l
-# apply to message
-total_df['arousal_mean'] = total_df['message'].apply(arousal_means)
-
-'''
-Get values of valence for all emojis found in message (as list).
-'''
-def valence_means(text):
-    # get crawled_data.csv from study
-    crawled_data = pd.read_csv('heuristics/emojis/crawled_data.csv', sep=',').drop(columns=drops_crawled, errors='ignore')
-    # list to store results in
-    valence_means_l = []
-    # find emojis and store them in list
-    em_list = re.findall(r':[a-z_]+:',text)
-    # iterate through emoji list
-    for i in em_list:
-        for idx, emoji in enumerate(crawled_data['unicode_name']):
-            # append valence value to valence list if emoji is found in crawled_data dataframe
-            if i == str(emoji):
-                valence_means_l.append(crawled_data['valence_mean'].iloc[idx])
-    return valence_means_l
-# apply to message
-total_df['valence_mean'] = total_df['message'].apply(valence_means)
-
-'''
-Get values of familarity for all emojis found in message (as list).
-'''
-def familarity_means(text):
-    # get crawled_data.csv from study
-    crawled_data = pd.read_csv('heuristics/emojis/crawled_data.csv', sep=',').drop(columns=drops_crawled, errors='ignore')
-    # list to store results in
-    familarity_means_l = []
-    # find emojis and store them in list
-    em_list = re.findall(r':[a-z_]+:',text)
-    # iterate through emoji list
-    for i in em_list:
-        for idx, emoji in enumerate(crawled_data['unicode_name']):
-            # append familarity value to familirity list if emoji is found in crawled_data dataframe
-            if i == str(emoji):
-                familarity_means_l.append(crawled_data['familarity_mean'].iloc[idx])
-    return familarity_means_l
-# apply to message
-total_df['familarity_mean'] = total_df['message'].apply(familarity_means)
-
-'''
-Get values of complexity for all emojis found in message (as list).
-'''
-def complexity_means(text):
-    # get crawled_data.csv from study
-    crawled_data = pd.read_csv('heuristics/emojis/crawled_data.csv', sep=',').drop(columns=drops_crawled, errors='ignore')
-    # list to store results in
-    complexity_means_l = []
-    # find emojis and store them in list
-    em_list = re.findall(r':[a-z_]+:',text)
-     # iterate through emoji list
-    for i in em_list:
-        for idx, emoji in enumerate(crawled_data['unicode_name']):
-            # append complexity value to complexity list if emoji is found in crawled_data dataframe
-            if i == str(emoji):
-                complexity_means_l.append(crawled_data['complexity_mean'].iloc[idx])
-    return complexity_means_l
-# apply to message
-total_df['complexity_mean'] = total_df['message'].apply(complexity_means)
+def check_engines(df):
+    scalar_df = add_heuristics(df, engine="scalar")
+    vectorized_df = add_heuristics(df, engine="vectorized")
+    # raises an AssertionError pointing to the first differing column
+    pd.testing.assert_frame_equal(scalar_df, vectorized_df)
+    print(f"Vectorized engine matches scalar engine on {len(df)} comments.")
+    return scalar_df
+
+# columns that are summed up for the terminal output
+sum_cols = ["plu_pro", "sin_pro", "word_count", "char_count", "allcaps_c", "emoji_count"]
+
+'''
+Print the sums of the count columns to the terminal.
+'''
+def print_sums(sums):
+    # get some information on data of whole table as well
+    sum_plu_pro = sums['plu_pro']
+    sum_sin_pro = sums['sin_pro']
+    sum_word_count = sums['word_count']
+    sum_char_count = sums['char_count']
+    sum_allcaps_c = sums['allcaps_c']
+    sum_emoji_count = sums['emoji_count']
+
+    # print to terminal
+    print(f"Sum plural pronouns: {sum_plu_pro} \nSum singular pronouns: {sum_sin_pro} \nSum word counts: {sum_word_count} \nSum character counts: {sum_char_count}\nSum all-caps words: {sum_allcaps_c}\nSum emoji count: {sum_emoji_count}")
 
-# get out directory as command line argument
-total_df.to_csv(sys.argv[2], index=False)
+# bump when the computed columns change, so stored concert results are not reused anymore
+FEATURES_VERSION = 1
+
+'''
+Helper: content hash of a concert (folder name + comments.csv) together with the lexicon version.
+'''
+def concert_key(csv_path, lexicon_key):
+    h = hashlib.sha256(f"{FEATURES_VERSION}|{lexicon_key}|{os.path.basename(os.path.dirname(csv_path))}|".encode())
+    with open(csv_path, 'rb') as f:
+        # read in blocks, so big files are not loaded at once
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+'''
+Compute the heuristics of a single concert (one shard of the sharded run).
+If cache_dir is given, the table is stored there under its content hash and reused as long as neither
+the comments.csv nor the lexicon files change.
+Returns the table and whether it came from the cache.
+'''
+def concert_heuristics(csv_path, engine="scalar", check=False, cache_dir=None, lexicon_key=None):
+    cache_path = None
+    # the check always recomputes both engines
+    if cache_dir and not check:
+        cache_path = os.path.join(cache_dir, concert_key(csv_path, lexicon_key) + ".pkl")
+        if os.path.exists(cache_path):
+            return pd.read_pickle(cache_path), True
+
+    df = read_concert(csv_path)
+    if check:
+        df = check_engines(df)
+    else:
+        df = add_heuristics(df, engine=engine)
+
+    if cache_path:
+        # write to a temporary file first, so an interrupted run never leaves a broken entry
+        tmp_path = cache_path + f".{os.getpid()}.tmp"
+        df.to_pickle(tmp_path)
+        os.replace(tmp_path, cache_path)
+    return df, False
+
+'''
+Process every concert as an independent shard (in a pool of worker processes if workers > 0).
+The results are appended to out_path in the order of find_concerts, so only a few concerts are in memory at once.
+Returns the sums of the count columns.
+'''
+def run_sharded(in_path, out_path, workers, engine="scalar", check=False, cache_dir=None):
+    csv_paths = find_concerts(in_path)
+    lexicon_key = None
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        lexicon_key = lexicon_version()
+    func = partial(concert_heuristics, engine=engine, check=check, cache_dir=cache_dir, lexicon_key=lexicon_key)
+
+    sums = pd.Series(0, index=sum_cols)
+    n_cached = 0
+    pool = multiprocessing.Pool(workers) if workers > 0 else None
+    try:
+        with CountsWriter(out_path) as writer:
+            # imap keeps the order of csv_paths, no matter which worker finishes first
+            results = pool.imap(func, csv_paths) if pool else map(func, csv_paths)
+            for concert_df, from_cache in results:
+                writer.write(concert_df)
+                sums = sums + concert_df[sum_cols].sum()
+                n_cached += from_cache
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    if cache_dir:
+        print(f"Reused {n_cached} of {len(csv_paths)} concerts from {cache_dir}, computed {len(csv_paths) - n_cached}.")
+    return sums
+
+
+'''
+Streaming run: reads every concert in chunks of chunksize rows, computes the heuristics per chunk and appends
+them to out_path right away. Only one chunk is in memory at a time, the sums are kept as running totals.
+'''
+def run_streaming(in_path, out_path, chunksize, engine="scalar", check=False):
+    sums = pd.Series(0, index=sum_cols)
+    with CountsWriter(out_path) as writer:
+        for csv_path in find_concerts(in_path):
+            for chunk in read_concert_chunks(csv_path, chunksize):
+                chunk = check_engines(chunk) if check else add_heuristics(chunk, engine=engine)
+                writer.write(chunk)
+                sums = sums + chunk[sum_cols].sum()
+    return sums
 
-# get some information on data of whole table as well
-sum_plu_pro = total_df['plu_pro'].sum()
-sum_sin_pro = total_df['sin_pro'].sum()
-sum_word_count = total_df['word_count'].sum()
-sum_char_count = total_df['char_count'].sum()
-sum_allcaps_c = total_df['allcaps_c'].sum()
-sum_emoji_count = total_df['emoji_count'].sum()
+def main():
+    parser = argparse.ArgumentParser(description="Add heuristic columns to the live comments of all concerts in a directory.")
+    parser.add_argument("in_path", help="Directory containing the concert folders (e.g. comments_live/annotation_round2)")
+    parser.add_argument("out_path", help="Output file, csv or .parquet (e.g. heuristics/annotation_round2/counts.csv)")
+    parser.add_argument(
+        "--engine",
+        choices=sorted(engines),
+        default="scalar",
+        help="Row-wise (scalar) or column-wise (vectorized) computation. Default: scalar",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Process every concert as a separate shard in N worker processes. Default: 0 (all concerts in one table)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Store the table of every concert here and only recompute new or changed concerts (e.g. heuristics/.cache).",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=0,
+        help="Read every comments.csv in chunks of N rows and write the results chunk by chunk (bounded memory). Default: 0 (whole files)",
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="Run both engines and check that they produce identical tables.",
+    )
+    args = parser.parse_args()
 
-# print to terminal
-print(f"Sum plural pronouns: {sum_plu_pro} \nSum singular pronouns: {sum_sin_pro} \nSum word counts: {sum_word_count} \nSum character counts: {sum_char_count}\nSum all-caps words: {sum_allcaps_c}\nSum emoji count: {sum_emoji_count}")
+    if args.chunksize > 0:
+        if args.workers > 0 or args.cache_dir:
+            parser.error("--chunksize can not be combined with --workers or --cache-dir")
+        # stream chunk by chunk into the output file
+        print_sums(run_streaming(args.in_path, args.out_path, args.chunksize, engine=args.engine, check=args.check))
+        return
 
+    if args.workers > 0 or args.cache_dir:
+        # stream one result per concert into the output file
+        print_sums(run_sharded(args.in_path, args.out_path, args.workers, engine=args.engine, check=args.check, cache_dir=args.cache_dir))
+        return
 
+    # get expected directory from command line argument
+    total_df = join_comments_live(args.in_path)
+    # compute all heuristic columns
+    if args.check:
+        total_df = check_engines(total_df)
+    else:
+        total_df = add_heuristics(total_df, engine=args.engine)
+    # get out directory as command line argument (csv or .parquet)
+    with CountsWriter(args.out_path) as writer:
+        writer.write(total_df)
+    print_sums(total_df[sum_cols].sum())
 
+if __name__ == "__main__":
+    main()
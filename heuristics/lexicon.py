@@ -0,0 +1,131 @@
+"""
+Loads the emoji lexicon once and turns it into a shortcode index for the heuristics.
+The following files are combined:
+- "emojis.csv" (official emoji-categories, one category per row)
+- "crawled_data.csv" (ratings from study "https://tscheffler.github.io/2024-Face-Emoji-Norming/ratings.html")
+Each shortcode (e.g. ":winking_face:") maps to (categories, ratings), so every emoji of a message is resolved with one lookup.
+The index can be stored as a binary (pickle) cache, which is rebuilt as soon as one of the csv files changes.
+"""
+import os
+import pickle
+import hashlib
+import re
+import pandas as pd
+
+# default locations (next to this file, so the lexicon can be loaded from any working directory)
+EMOJI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "emojis")
+EMOJIS_CSV = os.path.join(EMOJI_DIR, "emojis.csv")
+CRAWLED_CSV = os.path.join(EMOJI_DIR, "crawled_data.csv")
+CACHE_FILE = os.path.join(EMOJI_DIR, "lexicon_cache.pkl")
+
+# rating columns from the study (same order as the entries in the index)
+RATING_COLS = ["clarity_mean", "arousal_mean", "valence_mean", "familarity_mean", "complexity_mean"]
+# remove some of the crawled categories
+drops_crawled = ["emoji", "twitter_freq", "whatsapp_freq", "num_ratings"]
+
+# entry for shortcodes that are not part of the lexicon
+EMPTY_ENTRY = ((), ())
+
+# every ':[a-z_]+:' that occurs inside a cell (overlapping, e.g. ':flag:_canada:' contains ':flag:' and ':_canada:')
+cell_shortcodes = re.compile(r'(?=(:[a-z_]+:))')
+
+# bump when the layout of the index changes, so old caches are not used anymore
+CACHE_VERSION = 1
+
+# index of the default files (loaded on first use, see get_lexicon)
+lexicon_index = None
+
+'''
+Helper: make emojis.csv processable.
+'''
+def read_ragged_csv(filepath):
+    # open the file
+    with open(filepath, 'r', encoding='utf-8') as f:
+        lines = [line.strip().split(',') for line in f if line.strip()]
+
+    # get max number of columns
+    max_len = max(len(line) for line in lines)
+
+    # pad each line with empty strings if necessary
+    padded_lines = [line + [''] * (max_len - len(line)) for line in lines]
+
+    # convert to data frame
+    df = pd.DataFrame(padded_lines)
+    return df
+
+'''
+Build the index shortcode -> (categories, ratings).
+categories: names of all categories (rows of emojis.csv) containing the shortcode, in file order.
+ratings: one tuple with the values of RATING_COLS per matching row of crawled_data.csv.
+'''
+def build_index(emojis_path=EMOJIS_CSV, crawled_path=CRAWLED_CSV):
+    categories = {}
+    df_emoji = read_ragged_csv(emojis_path)
+    # iterate through the categories (first cell is the name of the category)
+    for row in df_emoji.itertuples(index=False):
+        found = set()
+        for cell in row:
+            # the old lookup matched case-insensitive substrings of the cells
+            found.update(cell_shortcodes.findall(str(cell).lower()))
+        # every row counts once per shortcode
+        for code in found:
+            categories.setdefault(code, []).append(row[0])
+
+    ratings = {}
+    crawled_data = pd.read_csv(crawled_path, sep=',').drop(columns=drops_crawled, errors='ignore')
+    for code, values in zip(crawled_data['unicode_name'].astype(str), crawled_data[RATING_COLS].itertuples(index=False)):
+        ratings.setdefault(code, []).append(tuple(float(v) for v in values))
+
+    # put both together
+    index = {}
+    for code in set(categories) | set(ratings):
+        index[code] = (tuple(categories.get(code, ())), tuple(ratings.get(code, ())))
+    return index
+
+'''
+Helper: get the modification times the cache is keyed on.
+'''
+def source_key(emojis_path, crawled_path):
+    return (CACHE_VERSION, os.path.getmtime(emojis_path), os.path.getmtime(crawled_path))
+
+'''
+Content hash of both lexicon files. Changes whenever categories or ratings change (used to invalidate stored results).
+'''
+def lexicon_version(emojis_path=EMOJIS_CSV, crawled_path=CRAWLED_CSV):
+    h = hashlib.sha256(str(CACHE_VERSION).encode())
+    for path in (emojis_path, crawled_path):
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+'''
+Load the index. Uses the binary cache if it belongs to the current csv files, rebuilds (and stores) it otherwise.
+Pass cache_path=None to skip the cache.
+'''
+def load_lexicon(emojis_path=EMOJIS_CSV, crawled_path=CRAWLED_CSV, cache_path=CACHE_FILE):
+    key = source_key(emojis_path, crawled_path)
+    # try to reuse the cache
+    if cache_path and os.path.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as f:
+                cached_key, index = pickle.load(f)
+            if cached_key == key:
+                return index
+        except Exception:
+            # broken or old cache -> rebuild
+            pass
+
+    index = build_index(emojis_path, crawled_path)
+    if cache_path:
+        with open(cache_path, 'wb') as f:
+            pickle.dump((key, index), f, protocol=pickle.HIGHEST_PROTOCOL)
+    return index
+
+'''
+Index of the default lexicon files. Loaded on the first call (not when the module is imported), then kept in memory.
+'''
+def get_lexicon():
+    global lexicon_index
+    if lexicon_index is None:
+        lexicon_index = load_lexicon()
+    return lexicon_index
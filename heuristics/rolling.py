@@ -0,0 +1,84 @@
+"""
+Rolling heuristics over the most recent messages of a live chat (used by getlivecomments.py --tail).
+Every message is run through extract_features (heuristics.py) once, its counts are added to running sums and
+removed again as soon as the message is older than the window, so a summary costs the same no matter how long the stream is.
+"""
+from collections import deque
+from heuristics import extract_features, total_list
+
+# columns of the summary rows (side file of the tailing mode)
+window_cols = ["window_end", "n_messages", "word_count", "emoji_count", "emojis_per_message",
+               "sin_pro", "plu_pro", "pronoun_ratio", "plural_share", "arousal_mean", "valence_mean"]
+
+# running sums kept per window
+sum_keys = ["word_count", "emoji_count", "sin_pro", "plu_pro", "arousal_sum", "arousal_n", "valence_sum", "valence_n"]
+
+'''
+Helper: mean that is empty (not 0) if nothing was counted.
+'''
+def safe_div(a, b):
+    return a / b if b else ''
+
+class RollingWindow:
+    '''
+    Keeps the messages of the last window_seconds seconds.
+    '''
+    def __init__(self, window_seconds=60):
+        self.window_seconds = window_seconds
+        # (time in seconds, counts of the message)
+        self.messages = deque()
+        self.sums = dict.fromkeys(sum_keys, 0)
+
+    '''
+    Add one message (time in seconds, e.g. the chat timestamp).
+    '''
+    def add(self, time_seconds, message):
+        _, values = extract_features(str(message))
+        features = dict(zip(total_list, values))
+        counts = {
+            "word_count": features["word_count"],
+            "emoji_count": features["emoji_count"],
+            "sin_pro": features["sin_pro"],
+            "plu_pro": features["plu_pro"],
+            "arousal_sum": sum(features["arousal_mean"]),
+            "arousal_n": len(features["arousal_mean"]),
+            "valence_sum": sum(features["valence_mean"]),
+            "valence_n": len(features["valence_mean"]),
+        }
+        self.messages.append((time_seconds, counts))
+        for key in sum_keys:
+            self.sums[key] += counts[key]
+
+    '''
+    Remove all messages that are older than the window (relative to now).
+    '''
+    def expire(self, now):
+        while self.messages and self.messages[0][0] <= now - self.window_seconds:
+            _, counts = self.messages.popleft()
+            for key in sum_keys:
+                self.sums[key] -= counts[key]
+        # start from exact zeros again (no rounding errors adding up over a long stream)
+        if not self.messages:
+            self.sums = dict.fromkeys(sum_keys, 0)
+
+    '''
+    Summary row (window_cols) of the messages in the window ending at now.
+    '''
+    def summary(self, now):
+        self.expire(now)
+        n = len(self.messages)
+        sums = self.sums
+        pronouns = sums["sin_pro"] + sums["plu_pro"]
+        return {
+            "window_end": now,
+            "n_messages": n,
+            "word_count": sums["word_count"],
+            "emoji_count": sums["emoji_count"],
+            "emojis_per_message": safe_div(sums["emoji_count"], n),
+            "sin_pro": sums["sin_pro"],
+            "plu_pro": sums["plu_pro"],
+            "pronoun_ratio": safe_div(pronouns, sums["word_count"]),
+            "plural_share": safe_div(sums["plu_pro"], pronouns),
+            "arousal_mean": safe_div(sums["arousal_sum"], sums["arousal_n"]),
+            "valence_mean": safe_div(sums["valence_sum"], sums["valence_n"]),
+        }
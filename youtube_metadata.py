@@ -0,0 +1,101 @@
+"""
+Shared client for YouTube video metadata (used by getlivecomments.py, getcomments_nonlive.py and create_annotation_file.py).
+Video lookups are batched (up to 50 IDs per API request) and every response is cached on disk per video ID,
+so the same video is requested only once (until the cache entry is older than the TTL).
+"""
+import os
+import json
+import time
+import threading
+from pyyoutube import Video
+
+# the YouTube Data API accepts at most 50 IDs per videos.list request
+MAX_IDS_PER_REQUEST = 50
+# default location of the cache (relative to the repository root) and time-to-live in seconds
+CACHE_DIR = ".cache/youtube_metadata"
+CACHE_TTL = 24 * 60 * 60
+
+class MetadataClient:
+    '''
+    Wraps a pyyoutube Api object. Pass cache_dir=None to only cache in memory.
+    '''
+    def __init__(self, api, cache_dir=CACHE_DIR, ttl=CACHE_TTL):
+        self.api = api
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        # video_id -> raw json of the video (already loaded or fetched in this run)
+        self.videos = {}
+        self.lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    '''
+    Helper: path of the cache file of a video.
+    '''
+    def cache_path(self, video_id):
+        return os.path.join(self.cache_dir, f"{video_id}.json")
+
+    '''
+    Helper: read a video from the disk cache (None if missing or expired).
+    '''
+    def load_cached(self, video_id):
+        if not self.cache_dir:
+            return None
+        path = self.cache_path(video_id)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry["fetched_at"] > self.ttl:
+            return None
+        return entry["video"]
+
+    '''
+    Helper: write a video to the disk cache.
+    '''
+    def store_cached(self, video_id, data):
+        if not self.cache_dir:
+            return
+        path = self.cache_path(video_id)
+        # write to a temporary file first, so parallel readers never see half a file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": time.time(), "video": data}, f)
+        os.replace(tmp_path, path)
+
+    '''
+    Get the video objects of many IDs. Only IDs that are not cached are requested, in batches of 50.
+    Returns a dict video_id -> pyyoutube Video (IDs unknown to YouTube are missing).
+    '''
+    def get_videos(self, video_ids):
+        video_ids = list(dict.fromkeys(video_ids))
+        with self.lock:
+            missing = []
+            for video_id in video_ids:
+                if video_id in self.videos:
+                    continue
+                cached = self.load_cached(video_id)
+                if cached is not None:
+                    self.videos[video_id] = cached
+                else:
+                    missing.append(video_id)
+
+            # request the missing ones in batches
+            for start in range(0, len(missing), MAX_IDS_PER_REQUEST):
+                batch = missing[start:start + MAX_IDS_PER_REQUEST]
+                data = self.api.get_video_by_id(video_id=batch, return_json=True)
+                for item in data.get("items", []):
+                    self.videos[item["id"]] = item
+                    self.store_cached(item["id"], item)
+
+            return {video_id: Video.from_dict(self.videos[video_id]) for video_id in video_ids if video_id in self.videos}
+
+    '''
+    Get the video object of one ID (raises a KeyError if the video does not exist).
+    '''
+    def get_video(self, video_id):
+        videos = self.get_videos([video_id])
+        if video_id not in videos:
+            raise KeyError(f"Video {video_id} not found")
+        return videos[video_id]